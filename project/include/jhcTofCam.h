@@ -25,8 +25,98 @@
 #include <pthread.h>
 
 
+//= Information about when and how a depth frame was captured.
+
+struct jhcTofMeta
+{
+  long long stamp;           // CLOCK_MONOTONIC ns when packet header seen
+  int frame;                 // count of frames processed since Start
+  int unit;                  // sensor depth step (mm) used for frame
+  int skip;                  // frames overwritten unread just before this
+  int orient;                // 0 = sensor scan order, 1 = upright
+  int fid;                   // frame id from sensor packet header
+  int lost;                  // sensor frames never received just before this
+  int temp;                  // raw sensor temperature from header
+  int expo;                  // raw exposure time from header
+};
+
+
+//= Adjustable processing parameters (see jhcTofCam public variables).
+
+struct jhcTofParams
+{
+  int sat, pct, ihi, cx0, cy0, cw, ch;           // auto-ranging
+  float f0, nv;                                  // temporal smoothing
+  int vlim;                                      // motion blanking
+  int upright;                                   // output orientation
+};
+
+
+//= Header of shared memory ring of frames for other processes.
+// slots start at byte "first", each "bytes" long (a jhcTofSlot)
+
+struct jhcTofRing
+{
+  int magic;                 // 0x31466F54 ("ToF1") once initialized
+  int slots;                 // number of frames held in ring
+  int bytes;                 // size of each slot 
+  int first;                 // offset of slot 0 from start of ring
+  int live;                  // 1 while publisher is streaming
+  int pid;                   // process id of publisher
+  long long head;            // sequence number of newest frame (0 = none)
+};
+
+
+//= One frame in shared memory ring (newest at head % slots).
+// seq is 0 while being rewritten, check it both before and after reading
+
+struct jhcTofSlot
+{
+  long long seq;             // ring sequence number of frame
+  jhcTofMeta meta;           // capture information
+  unsigned char img[20000];  // 16 bit range image 
+};
+
+
+//= Function run by acquisition thread whenever a new frame is published.
+// img is only valid until the function returns (copy it to keep it)
+
+typedef void (*jhcTofHook)(const unsigned char *img, const jhcTofMeta *meta, void *user);
+
+
+//= Acquisition health counters (since Start).
+
+struct jhcTofStats
+{
+  int frames;                // packets received from sensor
+  int junk;                  // bytes discarded while looking for header
+  int tmo;                   // serial read timeouts
+  int steps;                 // depth unit changes applied
+  int over;                  // frames replaced without being read or delivered
+  int bad;                   // packets dropped for bad checksum or format
+  int lost;                  // sensor frames missing (from frame id gaps)
+  int recon;                 // serial connections re-established
+  int down;                  // total ms spent reconnecting
+  int gap[20];               // inter-frame intervals in 10ms bins (190+)
+  int age[20];               // frame age at Range in 5ms bins (95+)
+};
+
+
+//= Everything about a new frame gathered by a single call.
+
+struct jhcTofShot
+{
+  const unsigned char *rng;  // 16 bit range image (as from Range)
+  const unsigned char *nite; // 8 bit inverted depth (NULL if not asked)
+  const unsigned char *mask; // 1250 byte packed validity bits for range
+  jhcTofMeta meta;           // capture information for range image
+};
+
+
 //= Interface to Sipeed MaixSense A010 Time-of-Flight sensor.
-// rotates through 3 element image buffers: xfill, xdone, xlock
+// rotates through pool of image buffers (default 3): fill, done, pinned
+// each extra reader cursor (beyond legacy Range) needs one more buffer
+// extra buffers can be leased by consumers to keep a history of frames
 // uses faster median algorithm with partial histogram scans
 // pipelines spatial and temporal filters for lower latency
 
@@ -35,16 +125,30 @@ class jhcTofCam
 // PRIVATE MEMBER VARIABLES
 private:
   // camera connection and health
+  char dev[80];
   int ser, ok;  
 
   // background receiver and pre-processing
   pthread_t hoover;
-  pthread_mutex_t data;
-  int run;
+  pthread_mutex_t data, proc;
+  pthread_cond_t arrive;
+  int run, patience;
+
+  // automatic reconnection (retry = max backoff ms, 0 = off)
+  // outage started at "tdown" (0 = none) and next attempt waits "backoff"
+  int retry, streak, backoff;
+  long long tdown;
+
+  // serial bytes received but not yet used (from rxi up to rxn)
+  unsigned char rx[4096];
+  int rxi, rxn;
 
-  // sensor input image
-  unsigned char pkt[10018];
-  unsigned char *raw;
+  // sensor input packets (one being received, other holds "raw" image)
+  unsigned char pkt[2][10018];
+  unsigned char *inp, *raw;
+
+  // header fields of last good packet (fid < 0 if none yet)
+  int fid, lost, temp, expo;
 
   // auto-ranging
   int cent[256];
@@ -61,17 +165,61 @@ private:
   // resolution scaling
   unsigned short norm[9][256];
 
-  // final 16 bit depth images
-  unsigned char d0[20000], d1[20000], d2[20000];
-  unsigned char *fill, *done, *lock;
-  int fresh;
+  // final 16 bit depth images (and packed validity bits for each)
+  // "used" if done image was pushed, captured, or leased (not just read)
+  unsigned char *pool, *vbits;
+  unsigned char *fill, *done;
+  int nbuf, pseq, fixed, used;
+  int *lease;
+
+  // reader cursors (0 = legacy Range) each pin last image returned
+  unsigned char *pin[8];
+  int seen[8], rdr[8];
+
+  // capture information for each output image
+  jhcTofMeta *info;
+  long long t0;
 
-  // debugging 8 bit depth image
-  unsigned char nite[10000];
+  // telemetry
+  jhcTofStats tally;
+  long long tlast;
+
+  // parameter changes waiting for frame boundary
+  jhcTofParams stage;
+  int restage;
+
+  // bulk recording of consecutive frames
+  unsigned char *cap_img;
+  jhcTofMeta *cap_info;
+  int cap_n, cap_got;
+
+  // frame arrival signal for event loops
+  int evt;
+
+  // frame arrival function for push consumers
+  jhcTofHook hook;
+  void *hook_arg;
+
+  // shared memory frame ring for other processes
+  char bus[80];
+  jhcTofRing *ring;
+  long long rlen, rseq;
+
+  // 8 bit depth image for each reader cursor
+  unsigned char nite[8][10000];
+
+  // upright versions of debugging images
+  unsigned char dbg[3][10000];
+
+  // unit viewing ray for each upright pixel (x right, y down, z out)
+  float ray[10000][3];
+  float flen, xc, yc;
 
 
 // PUBLIC MEMBER VARIABLES
 public:
+  // Note: while running only change these through SetParams()
+
   // auto-ranging parameters
   int sat, pct, ihi, cx0, cy0, cw, ch; 
 
@@ -79,6 +227,9 @@ public:
   float f0, nv;
   int vlim;
 
+  // output orientation (0 = sensor scan, 1 = upright)
+  int upright;
+
 
 // PUBLIC MEMBER FUNCTIONS
 public:
@@ -87,37 +238,90 @@ public:
   jhcTofCam ();
 
   // main functions
+  void Device (const char *name);
+  int Pool (int k);
   int Start (int port =0);
-  const unsigned char *Range (int block =0);
+  const unsigned char *Range (int block =0, int rd =0);
+  int RangeMeters (float *dest, int block =0, int mm =0, int rd =0);
+  int Grab (jhcTofShot *dest, int block =0, int sh =-1, int rd =0);
+  int Status () const {return ok;}
+  void Timeout (int ms);
+  void Reconnect (int ms =1000);
+  int Notify () const {return evt;}
+  void Callback (jhcTofHook fn, void *user =NULL);
+  int Publish (const char *name, int slots =8);
+  const jhcTofMeta *Meta (int rd =0) const;
+  const unsigned char *Valid (const unsigned char *img =NULL, int rd =0) const;
+  int Capture (int n, unsigned char *dest, jhcTofMeta *meta =NULL);
+  void Optics (float f =0.0, float cx =49.5, float cy =49.5);
+  int Cloud (float *dest, int step =1, int pack =1, int rd =0) const;
+  int RangeCopy (unsigned char *dest, int block =0, int rd =0);
+  int NightCopy (unsigned char *dest, int sh =0, int rd =0);
+  const unsigned char *Acquire (jhcTofMeta *meta =NULL);
+  void Release (const unsigned char *buf);
+  int AddReader ();
+  void DropReader (int rd);
   void Done ();
 
   // debugging functions (not sync'd with background)
   int Step () const {return unit;}
-  const unsigned char *Sensor () const {return raw;}
-  const unsigned char *Median () const {return((unsigned char *) med);}
-  const unsigned char *Kalman () const {return((unsigned char *) avg);}
-  const unsigned char *Night (int sh =0);
+  const unsigned char *Sensor () {return orient8(0, raw);}
+  const unsigned char *Median () {return orient8(1, med);}
+  const unsigned char *Kalman () {return orient8(2, avg);}
+  const unsigned char *Night (int sh =0, int rd =0);
+  int DebugCopy (unsigned char *dest, int n);
+  const unsigned char *Buffer (int i) const;
+
+  // telemetry
+  void Stats (jhcTofStats *dest);
+
+  // parameter adjustment
+  void GetParams (jhcTofParams *p);
+  void SetParams (const jhcTofParams *p);
 
 
 // PRIVATE MEMBER FUNCTIONS
 private:
   // creation and initialization
   void build_lut ();
+  void build_rays ();
 
   // main functions
   int open_usb ();
+  int claim (const char *name) const;
+  void config (int u);
 
   // background thread functions
   static void *absorb (void *tof);
   void main_loop ();
+  void adopt ();
   int sync ();
   int fill_raw ();
+  int gather (unsigned char *dest, int n);
+  int decode ();
+  int stalled ();
+  void tick (int *cnt, int n =1);
+  int revive ();
   void swap_bufs ();
+  void announce ();
+  void ring_put (const unsigned char *img, const jhcTofMeta *meta);
+  void ring_live (int v);
+  int slot (const unsigned char *buf) const;
+  int spare () const;
+  int nap (const timespec *limit);
+  void deadline (timespec *limit) const;
+  int unread () const;
+  static long long now_ns ();
 
   // image filtering
   void median5x5 ();
   void flywheel ();
   void reformat ();
+  void pack_valid ();
+  void metric (float *dest, const unsigned char *src, int mm) const;
+  const unsigned char *orient8 (int n, const unsigned char *src);
+  void rot8 (unsigned char *dest, const unsigned char *src) const;
+  void night8 (unsigned char *dest, const unsigned char *src, int sh) const;
 
   // range adjustment
   void auto_range ();
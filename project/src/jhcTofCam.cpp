@@ -20,11 +20,18 @@
 // 
 ///////////////////////////////////////////////////////////////////////////
 
+#include <errno.h>
 #include <stdio.h>
 #include <stdlib.h>
+#include <math.h>
 #include <fcntl.h>
+#include <sys/eventfd.h>
+#include <sys/file.h>
+#include <sys/mman.h>
+#include <poll.h>
 #include <termios.h>
 #include <unistd.h>
+#include <stdint.h>
 #include <string.h>
 #include <time.h>
 
@@ -40,6 +47,16 @@
 jhcTofCam::~jhcTofCam ()
 {
   Done();
+  Publish(NULL);
+  if (evt >= 0)
+    close(evt);
+  pthread_cond_destroy(&arrive);
+  pthread_mutex_destroy(&proc);
+  pthread_mutex_destroy(&data);
+  delete [] lease;
+  delete [] info;
+  delete [] vbits;
+  delete [] pool;
 }
 
 
@@ -50,8 +67,40 @@ jhcTofCam::jhcTofCam ()
   // 16 bit scaling for "unit" 
   build_lut();
 
-  // strip header from packet
-  raw = pkt + 16;
+  // point cloud geometry (66.6 degree FOV)
+  Optics();
+
+  // strip header from packet (receive into the other one)
+  raw = pkt[0] + 16;
+  inp = pkt[1];
+  rxi = 0;
+  rxn = 0;
+
+  // buffer interlock (object may be on heap)
+  pthread_mutex_init(&data, NULL);
+  pthread_mutex_init(&proc, NULL);
+
+  // new frame signal for blocking calls (immune to wall clock changes)
+  pthread_condattr_t ca;
+  pthread_condattr_init(&ca);
+  pthread_condattr_setclock(&ca, CLOCK_MONOTONIC);
+  pthread_cond_init(&arrive, &ca);
+  pthread_condattr_destroy(&ca);
+  patience = 500;                      // 0.5 sec max wait
+  retry = 0;                           // no automatic reconnection
+  backoff = 20;
+  tdown = 0;
+
+  // readable whenever a new frame is published (for select or poll)
+  evt = eventfd(0, EFD_NONBLOCK | EFD_CLOEXEC);
+
+  // no push consumer yet
+  hook = NULL;
+  hook_arg = NULL;
+  *bus = '\0';
+  ring = NULL;
+  rlen = 0;
+  rseq = 0;
 
   // auto-ranging
   sat = 80;                            // max frac saturated
@@ -67,11 +116,36 @@ jhcTofCam::jhcTofCam ()
   nv = 64.0;                           // expect 3 bits noise (8^2)
   vlim = 32;                           // too much flicker
 
+  // output format
+  upright = 0;                         // sensor scan order
+
   // procesing state
+  *dev = '\0';                         // probe for port
   ser = -1;
   ok = -1;
   run = 0;
   frame = 0;
+  restage = 0;
+  cap_n = 0;
+  cap_got = 0;
+
+  // only legacy reader cursor at first
+  for (int i = 0; i < 8; i++)
+  {
+    pin[i] = NULL;
+    seen[i] = 0;
+    rdr[i] = 0;
+  }
+  rdr[0] = 1;
+
+  // output image buffers
+  pool = NULL;
+  vbits = NULL;
+  info = NULL;
+  lease = NULL;
+  nbuf = 0;
+  fixed = 0;
+  Pool(3);
 }
 
 
@@ -88,35 +162,135 @@ void jhcTofCam::build_lut ()
 }
 
 
+//= Set camera intrinsics used for point clouds and rebuild ray table.
+// "f" is focal length in pixels (0 = default 76.1), "cx" and "cy" are 
+// optical center in upright image (USB on left: x right, y down)
+
+void jhcTofCam::Optics (float f, float cx, float cy)
+{
+  flen = ((f > 0.0) ? f : 76.1f);
+  xc = cx;
+  yc = cy;
+  build_rays();
+}
+
+
+//= Precompute unit length viewing ray for each pixel of upright image.
+// Cloud() maps sensor scan order images onto this as needed
+
+void jhcTofCam::build_rays ()
+{
+  float dx, dy, len;
+  int x, y;
+  float *v = ray[0];
+
+  for (y = 0; y < 100; y++)
+    for (x = 0; x < 100; x++, v += 3)
+    {
+      dx = (x - xc) / flen;
+      dy = (y - yc) / flen;
+      len = sqrtf(dx * dx + dy * dy + 1.0f);
+      v[0] = dx / len;
+      v[1] = dy / len;
+      v[2] = 1.0f / len;
+    }
+}
+
+
 ///////////////////////////////////////////////////////////////////////////
 //                              Main Functions                           //
 ///////////////////////////////////////////////////////////////////////////
 
+//= Select a particular serial device for the sensor (before Start).
+// useful with several sensors, e.g. "/dev/serial/by-id/usb-..."
+// NULL or empty string probes ttyUSB0 thru ttyUSB9 for a free port
+
+void jhcTofCam::Device (const char *name)
+{
+  if (name == NULL)
+    *dev = '\0';
+  else
+    snprintf(dev, sizeof(dev), "%s", name);
+}
+
+
+//= Set number of 16 bit output buffers (before first Start).
+// needs 3 for normal operation, each extra allows one more frame lease
+// buffers never move once handed out since callers may still hold views
+// returns 1 if okay, 0 if sensor has been started
+
+int jhcTofCam::Pool (int k)
+{
+  int i, lo = 3, n;
+
+  // each extra reader cursor needs its own buffer
+  for (i = 1; i < 8; i++)
+    if (rdr[i] > 0)
+      lo++;
+  n = ((k <= lo) ? lo : ((k < 64) ? k : 64));
+  if (n == nbuf)
+    return 1;
+  if (fixed > 0)
+    return 0;
+
+  // reallocate buffers (addresses change)
+  delete [] lease;
+  delete [] info;
+  delete [] vbits;
+  delete [] pool;
+  pool = new unsigned char [n * 20000];
+  vbits = new unsigned char [n * 1250];
+  info = new jhcTofMeta [n];
+  lease = new int [n];
+  nbuf = n;
+  return 1;
+}
+
+
 //= Open connection to sensor and start background acquisition thread.
 // "port" is lower COMx number in Windows Device Manager (Linux ignores)
 // returns 1 if okay, 0 or negative for error
 
 int jhcTofCam::Start (int port)
 {
+  int i;
+
   // establish USB serial connection
   ok = -1;
   if (open_usb() <= 0)
     return ok;
 
   // configure and start sensor
-  write(ser, "AT+DISP=3\r", 10);       // needs live display!
-  usleep(50000);                       // 50ms min between commands
-  write(ser, "AT+UNIT=2\r", 10);       // 2mm depth step                 
-  unit = 2;
-  pend = 2;   
+  config(2);                           // 2mm depth step
+
+  // nothing received yet
+  rxi = 0;
+  rxn = 0;
+  streak = 0;
+  tdown = 0;
 
   // initialize rotating buffers
-  fill = d0;
+  fill = pool;
   done = NULL;
-  lock = NULL;
-  fresh = -2;                          // first 2 are stale                       
+  pseq = 0;
+  used = 0;
+  for (i = 0; i < 8; i++)
+  {
+    pin[i] = NULL;
+    seen[i] = 2;                       // first 2 are stale
+  }
+  memset(info, 0, nbuf * sizeof(jhcTofMeta));
+  memset(lease, 0, nbuf * sizeof(int));
+  fixed = 1;                           // no reallocation from now on
+
+  // clear telemetry
+  memset(&tally, 0, sizeof(tally));
+  tlast = 0;
+  fid = -1;
+  lost = 0;
 
   // launch receiver and pre-processor thread
+  ring_live(1);
   run = 1;
   pthread_create(&hoover, NULL, absorb, (void *) this);
   ok = 1;
@@ -130,16 +304,22 @@ int jhcTofCam::Start (int port)
 
 int jhcTofCam::open_usb ()
 {
+  char name[40];
   struct termios tty;
+  int i;
 
-  // open USB connection to camera (try both USB0 and USB1)
-  ser = open("/dev/ttyUSB0", O_RDWR | O_NOCTTY | O_NDELAY);
+  // open USB connection to camera (given or first free of USB0-USB9)
+  if (*dev != '\0')
+    ser = claim(dev);
+  else
+    for (i = 0; i < 10; i++)
+    {
+      sprintf(name, "/dev/ttyUSB%d", i);
+      if ((ser = claim(name)) >= 0)
+        break;
+    }
   if (ser < 0)
-  {
-    ser = open("/dev/ttyUSB1", O_RDWR | O_NOCTTY | O_NDELAY);
-    if (ser < 0)
-      return -1;
-  }
+    return -1;
   fcntl(ser, F_SETFL, 0);              // clear status
   if (tcgetattr(ser, &tty) != 0) 
     return 0;
@@ -177,34 +357,377 @@ int jhcTofCam::open_usb ()
 }
 
 
+//= Open a serial port and get an exclusive lock on it.
+// lets several jhcTofCam objects (or processes) each find their own sensor
+// returns file descriptor, negative if missing or already in use
+
+int jhcTofCam::claim (const char *name) const
+{
+  int fd = open(name, O_RDWR | O_NOCTTY | O_NDELAY);
+
+  if (fd < 0)
+    return -1;
+  if (flock(fd, LOCK_EX | LOCK_NB) != 0)
+  {
+    close(fd);
+    return -1;
+  }
+  return fd;
+}
+
+
+//= Put sensor in streaming mode with given depth step (mm).
+// also used to restore configuration after a reconnection
+
+void jhcTofCam::config (int u)
+{
+  char cmd[20] = "AT+UNIT=2\r";
+
+  write(ser, "AT+DISP=3\r", 10);       // needs live display!
+  usleep(50000);                       // 50ms min between commands
+  cmd[8] = '0' + u;
+  write(ser, cmd, 10);                 
+  unit = u;
+  pend = u;
+}
+
+
 //= Get a pointer to the most recent 16 bit depth image from sensor.
 // buffer is always 100 x 100 with 16 bit pixels and 0.25mm resolution 
 // with USB on left: scans right-to-left, top-down from upper right corner
+// unless "upright" is set, then normal raster order from upper left corner
 // typically 14.8 fps, image guaranteed unchanged until next Range() call
+// "rd" selects reader cursor (from AddReader) with its own pinned image,
+// so separate threads each get every new frame (0 = legacy cursor)
+// if "block" > 0 sleeps until frame is published or Timeout passes
 // returns pixel buffer pointer, NULL if not ready or stream broken
 
-const unsigned char *jhcTofCam::Range (int block)
+const unsigned char *jhcTofCam::Range (int block, int rd)
 {
-  int wait = 0;
+  timespec limit;
+  int bin;
 
-  // check if source is operational and new frame is ready
-  if (ok <= 0)  
+  // check if source is operational 
+  if ((ok <= 0) || (rd < 0) || (rd >= 8) || (rdr[rd] <= 0))  
     return NULL;
-  while (fresh <= 0)
-  {
-    if (block <= 0)                    // return immediately
-      return NULL;
-    if (wait++ > 500)                  // barf after 0.5 sec
+  if (block > 0)
+    deadline(&limit);
+
+  // sleep until new frame is published (or timeout)
+  pthread_mutex_lock(&data);
+  while (pseq <= seen[rd])
+    if ((block <= 0) || (nap(&limit) <= 0))
+    {
+      pthread_mutex_unlock(&data);
       return NULL;
-    usleep(1000);                      // 1 ms loop
+    }
+
+  // pin buffer to be sure output pointer remains valid
+  pin[rd] = done;                      // mark as in-use
+  seen[rd] = pseq;
+  bin = (int)((now_ns() - info[slot(done)].stamp) / 5000000);
+  tally.age[(bin < 19) ? bin : 19] += 1;
+  pthread_mutex_unlock(&data);
+  return pin[rd];
+}
+
+
+//= Get newest range image, night view, and capture information at once.
+// same as Range(block) then Night(sh) and Meta() but one call for wrappers
+// skips night conversion if "sh" negative, images valid until next Range
+// returns 1 if new frame, 0 if not ready or stream broken (fields NULL)
+
+int jhcTofCam::Grab (jhcTofShot *dest, int block, int sh, int rd)
+{
+  if (dest == NULL)
+    return 0;
+  dest->nite = NULL;
+  dest->mask = NULL;
+  if ((dest->rng = Range(block, rd)) == NULL)
+    return 0;
+  if (sh >= 0)
+    dest->nite = Night(sh, rd);
+  dest->mask = Valid(dest->rng);
+  dest->meta = info[slot(dest->rng)];
+  return 1;
+}
+
+
+//= Get capture information for image last returned by Range().
+// stays valid (like the image itself) until next Range() call
+// returns NULL if no image has been returned yet
+
+const jhcTofMeta *jhcTofCam::Meta (int rd) const
+{
+  if ((ok <= 0) || (rd < 0) || (rd >= 8) || (pin[rd] == NULL))
+    return NULL;
+  return(info + slot(pin[rd]));
+}
+
+
+//= Get packed validity bits for some output image (default = last Range).
+// if "img" is NULL uses image last returned for reader cursor "rd"
+// 1250 bytes, MSB of byte 0 is pixel 0 (same order as image, matches
+// numpy unpackbits), bit is 0 where range is 65535 (invalid)
+// bits stay with image buffer so are good as long as the image is
+// returns NULL if image is not one of the output buffers
+
+const unsigned char *jhcTofCam::Valid (const unsigned char *img, int rd) const
+{
+  const unsigned char *src = img;
+
+  if ((src == NULL) && (rd >= 0) && (rd < 8))
+    src = pin[rd];
+  if ((src == NULL) || (src < pool) || (src >= pool + nbuf * 20000))
+    return NULL;
+  return(vbits + 1250 * slot(src));
+}
+
+
+//= Record next "n" consecutive depth images into a contiguous array.
+// "dest" must hold n * 20000 bytes, "meta" (if given) gets n entries
+// copying done by background thread so no frames are missed between calls
+// gives up if nothing arrives for Timeout (check "frame" values for gaps)
+// returns number of images actually recorded
+
+int jhcTofCam::Capture (int n, unsigned char *dest, jhcTofMeta *meta)
+{
+  timespec limit;
+  int got;
+
+  // register buffers with background thread
+  if ((ok <= 0) || (n <= 0) || (dest == NULL))
+    return 0;
+  pthread_mutex_lock(&data);
+  cap_img = dest;
+  cap_info = meta;
+  cap_got = 0;
+  cap_n = n;
+
+  // sleep until all frames are copied (limit restarts with progress)
+  deadline(&limit);
+  while ((got = cap_got) < n)
+  {
+    if (nap(&limit) <= 0)              // timeout or stream died
+      break;
+    if (cap_got > got)
+      deadline(&limit);
   }
 
-  // swap buffers to be sure output pointer remains valid
+  // stop background thread from writing any more 
+  cap_n = 0;
+  got = cap_got;
+  pthread_mutex_unlock(&data);
+  return got;
+}
+
+
+//= Set longest time blocking calls (Range, Capture) wait for a new frame.
+
+void jhcTofCam::Timeout (int ms)
+{
+  patience = ((ms > 0) ? ms : 0);
+}
+
+
+//= Keep trying to reopen the sensor if its serial stream dies.
+// waits 20ms before first attempt then doubles delay up to "ms" max
+// 0 disables (stream then ends with Status() = 0 as before)
+
+void jhcTofCam::Reconnect (int ms)
+{
+  retry = ((ms > 0) ? ((ms > 20) ? ms : 20) : 0);
+}
+
+
+//= Lease the most recent 16 bit depth image (independent of Range).
+// image is guaranteed unchanged until matching Release() call
+// fills in "meta" (if given) with capture information for image
+// at most pool size - 3 different images can be leased at once
+// (minus one for each extra reader cursor)
+// returns pixel buffer pointer, NULL if no frame yet or all buffers busy
+
+const unsigned char *jhcTofCam::Acquire (jhcTofMeta *meta)
+{
+  const unsigned char *buf = NULL;
+  int i;
+
+  if (ok <= 0)
+    return NULL;
   pthread_mutex_lock(&data);
-  lock = done;                         // mark as in-use
-  fresh = 0;
+  if ((done != NULL) && ((lease[slot(done)] > 0) || (spare() > 0)))
+  {
+    i = slot(done);
+    lease[i] += 1;
+    if (meta != NULL)
+      *meta = info[i];
+    buf = done;
+    used = 1;                          // counts as consumed
+  }
+  pthread_mutex_unlock(&data);
+  return buf;
+}
+
+
+//= Give back a depth image obtained from Acquire() so it can be reused.
+
+void jhcTofCam::Release (const unsigned char *buf)
+{
+  int i;
+
+  if ((buf < pool) || (buf >= pool + nbuf * 20000))
+    return;
+  i = slot(buf);
+  pthread_mutex_lock(&data);
+  if (lease[i] > 0)
+    lease[i] -= 1;
+  pthread_mutex_unlock(&data);
+}
+
+
+//= Make an independent reader cursor for Range, Grab, Meta, etc.
+// each cursor has its own last seen frame and pinned image, so threads
+// with separate cursors never recycle each other's images
+// needs one spare buffer (see Pool), grows pool if never started yet
+// returns cursor number (1-7), -1 if none available or no spare buffer
+
+int jhcTofCam::AddReader ()
+{
+  int i, rd = -1, n = 0;
+
+  // find unused cursor and count active ones
+  pthread_mutex_lock(&data);
+  for (i = 1; i < 8; i++)
+    if (rdr[i] > 0)
+      n++;
+    else if (rd < 0)
+      rd = i;
+  if ((rd > 0) && (fixed > 0) && (spare() <= 0))
+    rd = -1;
+  if (rd > 0)
+  {
+    rdr[rd] = 1;
+    pin[rd] = NULL;
+    seen[rd] = 2;                      // most recent frame is new
+  }
+  pthread_mutex_unlock(&data);
+
+  // make sure there is a buffer for it 
+  if ((rd > 0) && (fixed <= 0) && (nbuf < n + 4))
+    Pool(n + 4);
+  return rd;
+}
+
+
+//= Give up a reader cursor (and its pinned image).
+
+void jhcTofCam::DropReader (int rd)
+{
+  if ((rd <= 0) || (rd >= 8))
+    return;
+  pthread_mutex_lock(&data);
+  rdr[rd] = 0;
+  pin[rd] = NULL;
+  pthread_mutex_unlock(&data);
+}
+
+
+//= Get most recent depth image as floating point distances.
+// same as Range() but writes 100 x 100 floats into "dest" instead
+// values in meters (or millimeters if "mm" > 0), NaN for invalid pixels
+// returns 1 if new image converted, 0 if not ready or stream broken
+
+int jhcTofCam::RangeMeters (float *dest, int block, int mm, int rd)
+{
+  const unsigned char *src;
+
+  if (dest == NULL)
+    return 0;
+  if ((src = Range(block, rd)) == NULL)
+    return 0;
+  metric(dest, src, mm);
+  return 1;
+}
+
+
+//= Copy most recent depth image into caller's "dest" (20000 bytes).
+// same as Range(block, rd) but result never changes underneath caller
+// returns 1 if new image copied, 0 if not ready or stream broken
+
+int jhcTofCam::RangeCopy (unsigned char *dest, int block, int rd)
+{
+  const unsigned char *src;
+
+  if (dest == NULL)
+    return 0;
+  if ((src = Range(block, rd)) == NULL)
+    return 0;
+  pthread_mutex_lock(&data);
+  memcpy(dest, src, 20000);
+  pthread_mutex_unlock(&data);
+  return 1;
+}
+
+
+//= Convert image last returned by Range() into 3D points (in meters).
+// camera coordinates: x right, y down, z out (USB on left)
+// range treated as distance along each pixel's viewing ray
+// "dest" gets x y z triples for every "step" pixel in each direction
+// if "pack" > 0 skips invalid pixels, else leaves them as NaN triples
+// returns number of points written (0 if no image)
+
+int jhcTofCam::Cloud (float *dest, int step, int pack, int rd) const
+{
+  const unsigned short *s = (const unsigned short *)(((rd >= 0) && (rd < 8)) ? pin[rd] : NULL);
+  const float *v;
+  float *d = dest;
+  float r;
+  int i, j, up, n = 0, inc = ((step <= 1) ? 1 : step);
+
+  if ((dest == NULL) || (s == NULL))
+    return 0;
+  up = info[slot((const unsigned char *) s)].orient;
+  for (j = 0; j < 10000; j += 100 * inc)
+    for (i = j; i < j + 100; i += inc)
+    {
+      // scan row j / 100 is upright column 99 - j / 100
+      if (up > 0)
+        v = ray[i];
+      else
+        v = ray[100 * (i - j) + 99 - j / 100];
+      if (s[i] == 65535)
+      {
+        if (pack > 0)
+          continue;
+        d[0] = NAN;
+        d[1] = NAN;
+        d[2] = NAN;
+      }
+      else
+      {
+        r = 0.00025f * s[i];
+        d[0] = r * v[0];
+        d[1] = r * v[1];
+        d[2] = r * v[2];
+      }
+      d += 3;
+      n++;
+    }
+  return n;
+}
+
+
+//= Register a function to run as soon as each new frame is published.
+// called from acquisition thread with image, metadata, and user pointer
+// image stays valid until function returns so it should be quick
+// pass fn = NULL to remove any previous function
+
+void jhcTofCam::Callback (jhcTofHook fn, void *user)
+{
+  pthread_mutex_lock(&data);
+  hook = fn;
+  hook_arg = user;
   pthread_mutex_unlock(&data);
-  return lock;
 }
 
 
@@ -233,8 +756,76 @@ void jhcTofCam::Done ()
     ser = -1;
   }
 
-  // mark as un-initialized
+  // mark as un-initialized (and release any blocked readers)
+  ring_live(0);
+  pthread_mutex_lock(&data);
   ok = -1;
+  pthread_cond_broadcast(&arrive);
+  pthread_mutex_unlock(&data);
+}
+
+
+//= Copy each new frame into a named POSIX shared memory ring.
+// other processes map it read-only (e.g. TofCamClient) so no serial port needed
+// ring is recreated each call, name = NULL removes it (also at destruction)
+// returns 1 if okay, 0 for problem (no ring then)
+
+int jhcTofCam::Publish (const char *name, int slots)
+{
+  jhcTofRing r;
+  void *mem;
+  int fd, first = 64, sz = sizeof(jhcTofSlot);
+
+  // get rid of old ring (if any)
+  pthread_mutex_lock(&data);
+  mem = (void *) ring;
+  ring = NULL;
+  pthread_mutex_unlock(&data);
+  if (mem != NULL)
+  {
+    ((jhcTofRing *) mem)->live = 0;
+    munmap(mem, rlen);
+    shm_unlink(bus);
+    *bus = '\0';
+  }
+  if ((name == NULL) || (*name == '\0') || (slots < 2))
+    return 0;
+
+  // make new shared memory area of correct size
+  fd = shm_open(name, O_CREAT | O_RDWR, 0644);
+  if (fd < 0)
+    return 0;
+  rlen = first + (long long) slots * sz;
+  if (ftruncate(fd, rlen) != 0)
+  {
+    close(fd);
+    return 0;
+  }
+  mem = mmap(NULL, rlen, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+  close(fd);
+  if (mem == MAP_FAILED)
+    return 0;
+
+  // describe layout (magic last so readers see complete header)
+  memset(mem, 0, rlen);
+  r.magic = 0;
+  r.slots = slots;
+  r.bytes = sz;
+  r.first = first;
+  r.live = ((ok > 0) ? 1 : 0);
+  r.pid = (int) getpid();
+  r.head = 0;
+  memcpy(mem, &r, sizeof(r));
+  __atomic_store_n(&(((jhcTofRing *) mem)->magic), 0x31466F54, __ATOMIC_RELEASE);
+
+  // start filling from acquisition thread
+  strncpy(bus, name, 79);
+  bus[79] = '\0';
+  rseq = 0;
+  pthread_mutex_lock(&data);
+  ring = (jhcTofRing *) mem;
+  pthread_mutex_unlock(&data);
+  return 1;
 }
 
 
@@ -260,103 +851,494 @@ void jhcTofCam::main_loop ()
 {
   while (run > 0) 
   {
-    // get sensor pixels
-    if (sync() <= 0)
-      break;
-    if (fill_raw() <= 0)
-      break;
+    // get sensor pixels (possibly after restoring connection)
+    if ((sync() <= 0) || (fill_raw() <= 0))
+    {
+      if ((retry <= 0) || (revive() <= 0))
+        break;
+      continue;
+    }
+    if (decode() <= 0)
+      continue;              // never filter corrupted data
     
-    // analyze and filter image
+    // analyze and filter image (with consistent parameters)
+    pthread_mutex_lock(&proc);
+    raw = inp + 16;                    // swap in newest packet
+    inp = ((inp == pkt[0]) ? pkt[1] : pkt[0]);
+    adopt();
     auto_range();
     median5x5();
     flywheel();
     reformat();
+    pack_valid();
+    pthread_mutex_unlock(&proc);
     swap_bufs();
   }
+  pthread_mutex_lock(&data);
   ok = 0;                    // stream ended   
+  pthread_cond_broadcast(&arrive);
+  pthread_mutex_unlock(&data);
+  ring_live(0);
+  announce();                // wake any waiters
+}
+
+
+//= Install any parameter changes requested since last frame.
+// only called by background thread between frames 
+
+void jhcTofCam::adopt ()
+{
+  const jhcTofParams *p = &stage;
+
+  if (restage <= 0)
+    return;
+  pthread_mutex_lock(&data);
+  sat = p->sat;
+  pct = p->pct;
+  ihi = p->ihi;
+  cx0 = p->cx0;
+  cy0 = p->cy0;
+  cw  = p->cw;
+  ch  = p->ch;
+  f0  = p->f0;
+  nv  = p->nv;
+  vlim = p->vlim;
+  upright = p->upright;
+  restage = 0;
+  pthread_mutex_unlock(&data);
 }
 
 
 //= Look for beginning of image packet = start code + correct length.
+// reads serial data in chunks and scans with memchr, leaving any bytes
+// after the header in "rx" for fill_raw
 // returns 1 when found, 0 if stream broken
 
 int jhcTofCam::sync () 
 {
-  unsigned char b;
-  int start = 0;
+  unsigned char *s, *e;
+  int n, rc, skip = 0;
 
   // find start of next packet
   while (1)
-  {      
-    // punt if gibberish (sync never found)
-    if (start++ > 20000)
-      return 0;
+  {
+    // start code 0x00 0xFF then packet length 10016 = 0x2720 (little-endian)
+    s = rx + rxi;
+    e = rx + rxn;
+    while ((s = (unsigned char *) memchr(s, 0x00, e - s)) != NULL)
+    {
+      if ((e - s < 4) || ((s[1] == 0xFF) && (s[2] == 0x20) && (s[3] == 0x27)))
+        break;
+      s++;
+    }
+    if ((s != NULL) && (e - s >= 4))
+    {
+      skip += (int)(s - (rx + rxi));
+      rxi = (int)(s - rx) + 4;
+      break;
+    }
 
-    // start code = 0x00 0xFF
-    if (read(ser, &b, 1) <= 0)
-      return 0;
-    if (b != 0x00)
-      continue;
-    if (read(ser, &b, 1) <= 0)
-      return 0;
-    if (b != 0xFF)
-      continue;
+    // discard junk but keep any partial start code at end
+    n = ((s != NULL) ? (int)(s - rx) : rxn);
+    skip += n - rxi;
+    rxn -= n;
+    memmove(rx, rx + n, rxn);
+    rxi = 0;
 
-    // packet length 10016 = 0x2720 (little-endian)
-    if (read(ser, &b, 1) <= 0)
+    // punt if gibberish (sync never found)
+    if (skip > 20000)
       return 0;
-    if (b != 0x20)
-      continue;
-    if (read(ser, &b, 1) <= 0)
+    if ((rc = gather(rx + rxn, sizeof(rx) - rxn)) <= 0)
       return 0;
-    if (b == 0x27)
-      break;
+    rxn += rc;
   }
 
-  // assume extra bytes are response to "unit" command
-  if ((start > 1) && (frame > 2))
+  // remember when frame started arriving
+  t0 = now_ns();
+  tick(&tally.junk, skip);
+
+  // assume extra bytes are response to pending "unit" command
+  if ((skip > 0) && (frame > 2) && (pend != unit))
     depth_step();
   return 1;
 }
 
 
-//= Fills the "raw" image buffer with received serial bytes.
+//= Fills the "inp" packet buffer with received serial bytes.
 // whole packet = 16 byte header + 10000 byte image + 2 bytes at end
+// starts with bytes already read by sync (extras stay in "rx")
+// wakes as soon as more bytes arrive rather than sleeping a fixed time
 // returns 1 when successful, 0 if stream broken
 
 int jhcTofCam::fill_raw ()
 {
-  int rc, n = 0;                      
+  int rc, n = rxn - rxi;                      
 
-  while (1)
+  // use up bytes received along with header
+  n = ((n < 10018) ? n : 10018);
+  memcpy(inp, rx + rxi, n);
+  rxi += n;
+
+  // get rest of packet directly
+  while (n < 10018)
   {
-    rc = read(ser, pkt + n, 10018 - n);
-    if (rc <= 0)
-      return 0;                        // timeout
+    if ((rc = gather(inp + n, 10018 - n)) <= 0)
+      return 0;
     n += rc;
-    if (n >= 10018) 
-      break;
-    usleep(17500);                     // accumulate more bytes
   }
+  tick(&tally.frames);
+  streak += 1;
   return 1;
 }
 
 
+//= Read up to n bytes from sensor as soon as any are available.
+// waits 1 sec, or only 250ms if reconnection enabled and already streaming
+// returns count received, 0 if stalled or disconnected
+
+int jhcTofCam::gather (unsigned char *dest, int n)
+{
+  pollfd pfd;
+  int rc, ms = (((retry > 0) && (streak > 0)) ? 250 : 1000);
+
+  pfd.fd = ser;
+  pfd.events = POLLIN;
+  if (poll(&pfd, 1, ms) <= 0)
+    return stalled();
+  if ((rc = read(ser, dest, n)) <= 0)
+    return stalled();                  // unplugged
+  return rc;
+}
+
+
+//= Check integrity of packet just received and extract header fields.
+// header: cmd, mode, sensor temp, driver temp, exposure (4), error code, 
+//         reserved, rows, cols, frame id (2), ISP version, reserved
+// trailer: low byte of sum of all earlier bytes (incl. start code), 0xDD
+// also closes out any reconnection outage on the first good packet
+// returns 1 if okay, 0 if corrupted (counted in tally.bad)
+
+int jhcTofCam::decode ()
+{
+  const unsigned char *p = inp;
+  int i, id, sum = 0x00 + 0xFF + 0x20 + 0x27;   
+
+  // verify checksum, tail, and image size
+  for (i = 10016; i > 0; i--, p++)
+    sum += *p;
+  if (((sum & 0xFF) != inp[10016]) || (inp[10017] != 0xDD) ||
+      (inp[10] != 100) || (inp[11] != 100))
+  {
+    tick(&tally.bad);
+    return 0;
+  }
+
+  // count sensor frames never received (ids may only be 12 bits)
+  id = inp[12] | (inp[13] << 8);
+  lost = ((fid >= 0) ? ((id - fid - 1) & 0x0FFF) : 0);
+  tick(&tally.lost, lost);
+  fid = id;
+
+  // other sensor information
+  temp = inp[2];
+  expo = inp[4] | (inp[5] << 8) | (inp[6] << 16) | (inp[7] << 24);
+
+  // first good packet ends any reconnection outage
+  if (tdown > 0)
+  {
+    pthread_mutex_lock(&data);
+    tally.recon += 1;
+    tally.down += (int)((now_ns() - tdown) / 1000000);
+    pthread_mutex_unlock(&data);
+    tdown = 0;
+  }
+  return 1;
+}
+
+
+//= Note that serial port read timed out (or failed).
+// always returns 0 for convenience
+
+int jhcTofCam::stalled ()
+{
+  tick(&tally.tmo);
+  return 0;
+}
+
+
+//= Add to one telemetry counter (locked so Stats copies a consistent set).
+
+void jhcTofCam::tick (int *cnt, int n)
+{
+  pthread_mutex_lock(&data);
+  *cnt += n;
+  pthread_mutex_unlock(&data);
+}
+
+
+//= Re-establish serial connection after sensor stopped sending.
+// reopens port with exponential backoff then restores streaming mode 
+// keeps current depth step so temporal filter remains consistent
+// backoff keeps growing if port reopens but sensor stays silent
+// outage only ends (and is counted) when decode gets a good packet
+// returns 1 if sensor reconfigured, 0 if asked to stop first
+
+int jhcTofCam::revive ()
+{
+  int i;
+
+  // note start of outage (unless still in one)
+  if (tdown <= 0)
+  {
+    tdown = now_ns();
+    backoff = 20;
+  }
+
+  // drop old connection (device may have vanished)
+  close(ser);
+  ser = -1;
+  while (run > 0)
+  {
+    // wait a bit longer each time (but notice stop request quickly)
+    for (i = 0; (i < backoff) && (run > 0); i += 10)
+      usleep(10000);
+    if (run <= 0)
+      break;
+    i = open_usb();
+    backoff = ((2 * backoff < retry) ? 2 * backoff : retry);
+    if (i > 0)
+    {
+      // resume streaming without any stale bytes
+      config(unit);
+      rxi = 0;
+      rxn = 0;
+      streak = 0;
+      fid = -1;
+      return 1;
+    }
+    if (ser >= 0)
+      close(ser);
+    ser = -1;
+  }
+  return 0;
+}
+
+
 //= Mark filtering as completed and shuffle output images.
+// next fill is any buffer not just finished, in use by Range, or leased
+// if all others are held then frame is not published (fill is reused)
 
 void jhcTofCam::swap_bufs ()
 {
+  jhcTofMeta snap;
+  jhcTofHook fn = NULL;
+  void *arg = NULL;
+  int i, k, n, now = slot(fill), nxt = -1, pub = 0, took = 0;
+  jhcTofMeta *m = info + now;
+
+  // stamp newly completed image (count previous if never read)
   pthread_mutex_lock(&data);
-  done = fill;                         // most recent complete
-  fresh += 1;
-  if (fill == d0)
-    fill = ((lock != d1) ? d1 : d2);
-  else if (fill == d1)
-    fill = ((lock != d0) ? d0 : d2);
-  else                                 // lock == d2             
-    fill = ((lock != d0) ? d0 : d1);
+  m->stamp = t0;
+  m->frame = frame;
+  m->unit = unit;
+  m->skip = (((unread() > 0) && (done != NULL)) ? info[slot(done)].skip + 1 : 0);
+  m->fid = fid;
+  m->lost = lost;
+  m->temp = temp;
+  m->expo = expo;
+
+  // update frame interval histogram 
+  if (tlast > 0)
+  {
+    i = (int)((t0 - tlast) / 10000000);
+    tally.gap[(i < 19) ? i : 19] += 1;
+  }
+  tlast = t0;
+
+  // copy into bulk recording (if any) once past stale frames
+  if ((cap_got < cap_n) && (pseq >= 2))
+  {
+    memcpy(cap_img + 20000 * cap_got, fill, 20000);
+    if (cap_info != NULL)
+      cap_info[cap_got] = *m;
+    cap_got++;
+    took = 1;
+  }
+
+  // look for a free buffer after current one
+  for (n = 1; n < nbuf; n++)
+  {
+    i = (now + n) % nbuf;
+    if (lease[i] > 0)
+      continue;
+    for (k = 0; k < 8; k++)
+      if ((rdr[k] > 0) && (pin[k] == pool + 20000 * i))
+        break;
+    if (k >= 8)
+    {
+      nxt = i;
+      break;
+    }
+  }
+
+  // shuffle output buffers
+  if ((nxt < 0) || ((unread() > 0) && (used <= 0)))
+    tally.over += 1;                   // something never seen
+  if (nxt >= 0)
+  {
+    done = fill;                       // most recent complete
+    pseq += 1;
+    fill = pool + 20000 * nxt;
+    used = took;
+    pthread_cond_broadcast(&arrive);   // wake blocked readers
+    if (pseq > 2)                      // skip stale frames
+    {
+      pub = 1;
+      fn = hook;                       // push to consumer (if any)
+      arg = hook_arg;
+      snap = *m;
+      if ((fn != NULL) || (ring != NULL))
+        used = 1;
+    }
+  }
   pthread_mutex_unlock(&data);
   frame++;                             // increment frame count
+  announce();
+
+  // only this thread rewrites "done" so it is stable during these
+  if (pub <= 0)
+    return;
+  ring_put(done, &snap);
+  if (fn != NULL)
+    (*fn)(done, &snap, arg);
+}
+
+
+//= Copy a completed frame into the next slot of the shared memory ring.
+// slot sequence number is zeroed during rewrite so readers can detect tears
+// holds lock so Publish cannot unmap ring in the middle
+
+void jhcTofCam::ring_put (const unsigned char *img, const jhcTofMeta *meta)
+{
+  jhcTofSlot *s;
+
+  pthread_mutex_lock(&data);
+  if (ring == NULL)
+  {
+    pthread_mutex_unlock(&data);
+    return;
+  }
+  rseq++;
+  s = (jhcTofSlot *)((char *) ring + ring->first + (rseq % ring->slots) * ring->bytes);
+  __atomic_store_n(&(s->seq), 0, __ATOMIC_RELEASE);
+  __atomic_thread_fence(__ATOMIC_SEQ_CST);
+  s->meta = *meta;
+  memcpy(s->img, img, 20000);
+  __atomic_store_n(&(s->seq), rseq, __ATOMIC_RELEASE);
+  __atomic_store_n(&(ring->head), rseq, __ATOMIC_RELEASE);
+  pthread_mutex_unlock(&data);
+}
+
+
+//= Tell readers of shared memory ring whether frames are still coming.
+
+void jhcTofCam::ring_live (int v)
+{
+  pthread_mutex_lock(&data);
+  if (ring != NULL)
+    ring->live = v;
+  pthread_mutex_unlock(&data);
+}
+
+
+//= Tell which output buffer (0 to nbuf-1) some image pointer refers to.
+
+int jhcTofCam::slot (const unsigned char *buf) const
+{
+  return((int)(buf - pool) / 20000);
+}
+
+
+//= Count how many buffers are left over for new leases or reader cursors.
+// fill, done, and legacy cursor image always need one each
+// call with mutex held
+
+int jhcTofCam::spare () const
+{
+  int i, n = nbuf - 3;
+
+  for (i = 1; i < 8; i++)
+    if (rdr[i] > 0)
+      n--;
+  for (i = 0; i < nbuf; i++)
+    if (lease[i] > 0)
+      n--;
+  return n;
+}
+
+
+//= Compute time when a blocking call should give up (now + patience).
+
+void jhcTofCam::deadline (timespec *limit) const
+{
+  clock_gettime(CLOCK_MONOTONIC, limit);
+  limit->tv_sec  += patience / 1000;
+  limit->tv_nsec += (patience % 1000) * 1000000;
+  if (limit->tv_nsec >= 1000000000)
+  {
+    limit->tv_sec  += 1;
+    limit->tv_nsec -= 1000000000;
+  }
+}
+
+
+//= Sleep until something is published or "limit" passes (mutex held).
+// returns 1 if woken while stream still running, 0 if timeout or stopped
+
+int jhcTofCam::nap (const timespec *limit)
+{
+  if (ok <= 0)
+    return 0;
+  if (pthread_cond_timedwait(&arrive, &data, limit) == ETIMEDOUT)
+    return 0;
+  return((ok > 0) ? 1 : 0);
+}
+
+
+//= Tell if most recent published image has not been read by any cursor.
+
+int jhcTofCam::unread () const
+{
+  int i;
+
+  for (i = 0; i < 8; i++)
+    if ((rdr[i] > 0) && (seen[i] >= pseq))
+      return 0;
+  return 1;
+}
+
+
+//= Get a 64 bit integer with number of nanoseconds on monotonic clock.
+// same clock as Python time.monotonic() so ages can be compared
+
+long long jhcTofCam::now_ns () 
+{
+  timespec ts;
+
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return((long long) ts.tv_sec * 1000000000 + ts.tv_nsec);
+}
+
+
+//= Make "evt" file descriptor readable to wake up any event loop.
+// counter accumulates until waiter reads 8 bytes from descriptor
+
+void jhcTofCam::announce ()
+{
+  uint64_t one = 1;
+
+  if (evt >= 0)
+    write(evt, &one, sizeof(one));
 }
 
 
@@ -486,7 +1468,7 @@ void jhcTofCam::flywheel ()
     // see how much raw pixels are varying to get mix factor
     diff = (*m) - (*p);
     vm   = cfi * (*v) + fi * diff * diff;
-    k    = (vm << 8) / (vm + mn);
+    k    = (int)(((long long) vm << 8) / (vm + mn));   // vm can be 2^24
 
     // use mix factor to update estimates of average and variance
     val  = (((*p) << 8) + k * diff + 128) >> 8;
@@ -502,16 +1484,62 @@ void jhcTofCam::flywheel ()
 
 void jhcTofCam::reformat ()
 {
-  int i;
+  int r, c, up = upright, step = ((up > 0) ? 100 : 1);
   const unsigned short *sc = norm[unit - 1];
-  unsigned short *d = (unsigned short *) fill;
+  unsigned short *d, *d0 = (unsigned short *) fill;
   const unsigned char *s = raw, *p = avg, *v = var;
 
-  for (i = 0; i < 10000; i++, d++, s++, p++, v++)
-    if ((*s >= 255) || (*p >= 255) || (*v > vlim)) 
-      *d = 65535;
-    else 
-      *d = sc[*p];           // adjust for "unit" resolution
+  // upright writes scan row r down output column 99 - r 
+  info[slot(fill)].orient = up;
+  for (r = 0; r < 100; r++)
+  {
+    d = d0 + ((up > 0) ? 99 - r : 100 * r);
+    for (c = 0; c < 100; c++, d += step, s++, p++, v++)
+      if ((*s >= 255) || (*p >= 255) || (*v > vlim)) 
+        *d = 65535;
+      else 
+        *d = sc[*p];         // adjust for "unit" resolution
+  }
+}
+
+
+//= Record which pixels of newly formatted image have valid range.
+// packs 8 pixels per byte (first is MSB) for compact validity masks
+
+void jhcTofCam::pack_valid ()
+{
+  const unsigned short *s = (const unsigned short *) fill;
+  unsigned char *m = vbits + 1250 * slot(fill);
+  int i;
+
+  for (i = 0; i < 1250; i++, s += 8)
+    m[i] = (unsigned char)(((s[0] != 65535) << 7) | ((s[1] != 65535) << 6) |
+                           ((s[2] != 65535) << 5) | ((s[3] != 65535) << 4) |
+                           ((s[4] != 65535) << 3) | ((s[5] != 65535) << 2) |
+                           ((s[6] != 65535) << 1) |  (s[7] != 65535));
+}
+
+
+//= Convert a 16 bit depth image into floating point distances.
+// gives meters (or millimeters if "mm" > 0) with NaN for invalid pixels
+
+void jhcTofCam::metric (float *dest, const unsigned char *src, int mm) const
+{
+  float sc = ((mm > 0) ? 0.25f : 0.00025f);
+  const unsigned short *s = (const unsigned short *) src;
+  unsigned int bits;
+  float v;
+  int i;
+
+  // force invalid pixels to quiet NaN by OR'ing in exponent bits 
+  // branchless so compiler can vectorize (about 3x faster on -O3)
+  for (i = 0; i < 10000; i++)
+  {
+    v = sc * s[i];
+    memcpy(&bits, &v, 4);
+    bits |= (0 - (unsigned int)(s[i] == 65535)) & 0x7FC00000;
+    memcpy(dest + i, &bits, 4);
+  }
 }
 
 
@@ -590,6 +1618,7 @@ void jhcTofCam::depth_step ()
 
   // record current sensor resolution
   unit = pend;
+  tick(&tally.steps);
 }
 
 
@@ -597,23 +1626,187 @@ void jhcTofCam::depth_step ()
 //                          Debugging Functions                            //
 /////////////////////////////////////////////////////////////////////////////
 
+//= Give debugging image in same orientation as output range images.
+// returns source itself if sensor scan order, else rotated copy "n"
+
+const unsigned char *jhcTofCam::orient8 (int n, const unsigned char *src)
+{
+  if (upright <= 0)
+    return src;
+  rot8(dbg[n], src);
+  return dbg[n];
+}
+
+
+//= Copy 8 bit sensor scan order image into "dest" as upright image.
+
+void jhcTofCam::rot8 (unsigned char *dest, const unsigned char *src) const
+{
+  unsigned char *d;
+  const unsigned char *s = src;
+  int r, c;
+
+  for (r = 0; r < 100; r++)
+    for (c = 0, d = dest + 99 - r; c < 100; c++, d += 100, s++)
+      *d = *s;
+}
+
+
+//= Copy a consistent version of a debugging image into "dest" (10000 bytes).
+// n: 0 = sensor, 1 = median, 2 = Kalman (in same orientation as Range)
+// waits for the processing step so image is never half updated
+// returns 1 if okay, 0 for bad arguments
+
+int jhcTofCam::DebugCopy (unsigned char *dest, int n)
+{
+  const unsigned char *src[3] = {raw, med, avg};
+
+  if ((dest == NULL) || (n < 0) || (n > 2))
+    return 0;
+  pthread_mutex_lock(&proc);
+  if (upright > 0)
+    rot8(dest, src[n]);
+  else
+    memcpy(dest, src[n], 10000);
+  pthread_mutex_unlock(&proc);
+  return 1;
+}
+
+
 //= Make an 8 bit grayscale image where close things are BRIGHTER.
 // "sh" sets max range: 0 = 25cm, 1 = 51cm, 2 = 102cm, 3 = 204cm, 4 = 409cm 
 // Note: must call Range(1) first to update source image to converter
 
-const unsigned char *jhcTofCam::Night (int sh)
+const unsigned char *jhcTofCam::Night (int sh, int rd)
 {
+  if ((rd < 0) || (rd >= 8) || (pin[rd] == NULL))
+    return NULL;                       // from Range(1)
+  night8(nite[rd], pin[rd], sh);
+  return nite[rd];
+}
+
+
+//= Same as Night() but writes 8 bit image into caller's "dest" instead.
+// returns 1 if okay, 0 if no range image returned yet
+
+int jhcTofCam::NightCopy (unsigned char *dest, int sh, int rd)
+{
+  if ((dest == NULL) || (rd < 0) || (rd >= 8) || (pin[rd] == NULL))
+    return 0;
+  night8(dest, pin[rd], sh);
+  return 1;
+}
+
+
+//= Convert 16 bit range image "src" to inverted 8 bit image in "dest".
+
+void jhcTofCam::night8 (unsigned char *dest, const unsigned char *src, int sh) const
+{
+  const unsigned short *s = (const unsigned short *) src;                
+  unsigned char *d = dest;
   int i, v, dn = sh + 2;
-  unsigned char *d = nite;
-  const unsigned short *s = (unsigned short *) lock;                
 
-  if (s == NULL)                       // from Range(1)
-    return NULL;
   for (i = 10000; i > 0; i--, s++, d++)
   {
     v = *s >> dn;
     v = ((v < 255) ? v : 255);
     *d = (unsigned char)(255 - v);
   }
-  return nite;
+}
+
+
+//= Address of one of the fixed 16 bit output buffers (0 to pool size - 1).
+// Range() only ever returns one of these so wrappers can cache views
+// addresses only change if Pool() is called with a different size,
+// which is only allowed before the first Start()
+// returns NULL if index out of bounds
+
+const unsigned char *jhcTofCam::Buffer (int i) const
+{
+  if ((i < 0) || (i >= nbuf))
+    return NULL;
+  return(pool + 20000 * i);
+}
+
+
+/////////////////////////////////////////////////////////////////////////////
+//                               Telemetry                                 //
+/////////////////////////////////////////////////////////////////////////////
+
+//= Get a snapshot of acquisition health counters since Start.
+// frames received, junk bytes, timeouts, unit changes, frames never used,
+// bad packets, lost frames, reconnections and time spent reconnecting,
+// histogram of inter-frame intervals (10ms bins), and histogram of
+// frame age when Range returned it (5ms bins)
+// all counters change under the same lock so the set is consistent
+
+void jhcTofCam::Stats (jhcTofStats *dest)
+{
+  if (dest == NULL)
+    return;
+  pthread_mutex_lock(&data);
+  *dest = tally;
+  pthread_mutex_unlock(&data);
+}
+
+
+/////////////////////////////////////////////////////////////////////////////
+//                         Parameter Adjustment                            //
+/////////////////////////////////////////////////////////////////////////////
+
+//= Get current values of processing parameters.
+// reports any change still waiting to be applied at next frame
+
+void jhcTofCam::GetParams (jhcTofParams *p)
+{
+  if (p == NULL)
+    return;
+  pthread_mutex_lock(&data);
+  if (restage > 0)
+    *p = stage;
+  else
+  {
+    p->sat = sat;
+    p->pct = pct;
+    p->ihi = ihi;
+    p->cx0 = cx0;
+    p->cy0 = cy0;
+    p->cw  = cw;
+    p->ch  = ch;
+    p->f0  = f0;
+    p->nv  = nv;
+    p->vlim = vlim;
+    p->upright = upright;
+  }
+  pthread_mutex_unlock(&data);
+}
+
+
+//= Request new processing parameters (safe while sensor is running).
+// values are forced into legal ranges then all swapped in together
+// before processing of the next frame (immediately if not running)
+
+void jhcTofCam::SetParams (const jhcTofParams *p)
+{
+  jhcTofParams *s = &stage;
+
+  if (p == NULL)
+    return;
+  pthread_mutex_lock(&data);
+  *s = *p;
+  s->sat = ((s->sat <= 0) ? 0 : ((s->sat < 100) ? s->sat : 100));
+  s->pct = ((s->pct <= 0) ? 0 : ((s->pct < 100) ? s->pct : 100));
+  s->ihi = ((s->ihi <= 1) ? 1 : s->ihi);
+  s->cx0 = ((s->cx0 <= 0) ? 0 : ((s->cx0 < 99) ? s->cx0 : 99));
+  s->cy0 = ((s->cy0 <= 0) ? 0 : ((s->cy0 < 99) ? s->cy0 : 99));
+  s->cw  = ((s->cw <= 1) ? 1 : ((s->cw < 100 - s->cx0) ? s->cw : 100 - s->cx0));
+  s->ch  = ((s->ch <= 1) ? 1 : ((s->ch < 100 - s->cy0) ? s->ch : 100 - s->cy0));
+  s->f0  = ((s->f0 <= 0.0) ? 0.0f : ((s->f0 < 1.0) ? s->f0 : 1.0f));
+  s->nv  = ((s->nv <= 0.01) ? 0.01f : s->nv);
+  s->vlim = ((s->vlim <= 0) ? 0 : ((s->vlim < 255) ? s->vlim : 255));
+  s->upright = ((s->upright > 0) ? 1 : 0);
+  restage = 1;
+  pthread_mutex_unlock(&data);
+  if (run <= 0)
+    adopt();
 }
@@ -27,63 +27,348 @@
 //                          Global Variables                             //
 ///////////////////////////////////////////////////////////////////////////
 
-//= Class with interface driver and post-processing cleanup.
+//= Default class used by original single sensor functions (tof_xxx).
 
 static jhcTofCam tof;
 
 
 ///////////////////////////////////////////////////////////////////////////
-//                           Main Functions                              //
+//                          Sensor Handles                               //
 ///////////////////////////////////////////////////////////////////////////
 
+//= Make a new independent sensor interface with its own background thread.
+// handle is used with all tofh_xxx functions, release with tof_close()
+// returns opaque handle, NULL if failed
+
+extern "C" void *tof_open ()
+{
+  return new jhcTofCam;
+}
+
+
+//= Stop sensor (if running) and release interface made by tof_open().
+
+extern "C" void tof_close (void *h)
+{
+  if ((h != NULL) && (h != &tof))
+    delete (jhcTofCam *) h;
+}
+
+
+///////////////////////////////////////////////////////////////////////////
+//                        Handle Main Functions                          //
+///////////////////////////////////////////////////////////////////////////
+
+//= Select a particular serial device for the sensor (before start).
+// useful with several sensors, e.g. "/dev/serial/by-id/usb-..."
+// NULL or empty string probes ttyUSB0 thru ttyUSB9 for a free port
+
+extern "C" void tofh_device (void *h, const char *name)
+{
+  ((jhcTofCam *) h)->Device(name);
+}
+
+
+//= Set number of 16 bit output buffers (before first start, 3 or more).
+// each buffer beyond 3 allows one more frame to be leased at a time
+// returns 1 if okay, 0 if sensor has been started
+
+extern "C" int tofh_pool (void *h, int k)
+{
+  return ((jhcTofCam *) h)->Pool(k);
+}
+
+
+//= Choose orientation of output images (takes effect on next frame).
+// 0 = sensor scan order (right-to-left, top-down from upper right)
+// 1 = upright OpenCV order with USB on left (no rotation needed)
+// also applies to night and debugging images
+
+extern "C" void tofh_upright (void *h, int up)
+{
+  jhcTofParams p;
+
+  ((jhcTofCam *) h)->GetParams(&p);
+  p.upright = up;
+  ((jhcTofCam *) h)->SetParams(&p);
+}
+
+
 //= Open connection to sensor and start background acquisition thread.
 // "port" is lower COMx number in Windows Device Manager (Linux ignores)
 // returns 1 if okay, 0 or negative for error
 
-extern "C" int tof_start (int port)
+extern "C" int tofh_start (void *h, int port)
 {
-  return tof.Start(port);
+  return ((jhcTofCam *) h)->Start(port);
 }
 
 
 //= Get a pointer to the most recent 16 bit depth image from sensor.
 // buffer is always 100 x 100 with 16 bit pixels and 0.25mm resolution 
 // with USB on left: scans right-to-left, top-down from upper right corner
+// unless tofh_upright() used, then normal raster order from upper left
 // typically 14.8 fps, image guaranteed unchanged until next Range() call
 // returns pixel buffer pointer, NULL if not ready or stream broken
 
-extern "C" const unsigned char *tof_range (int block)
+extern "C" const unsigned char *tofh_range (void *h, int block)
+{
+  return ((jhcTofCam *) h)->Range(block);
+}
+
+
+//= Get newest range image, night view, and capture information at once.
+// same as tofh_range(), tofh_night(), and tofh_meta() but one call
+// skips night conversion if "sh" negative, images valid until next range
+// returns 1 if new frame, 0 if not ready or stream broken (fields NULL)
+
+extern "C" int tofh_grab (void *h, jhcTofShot *dest, int block, int sh)
+{
+  return ((jhcTofCam *) h)->Grab(dest, block, sh);
+}
+
+
+//= Get most recent depth image as floating point distances.
+// same as tofh_range() but writes 100 x 100 floats into "dest" instead
+// values in meters (or millimeters if "mm" > 0), NaN for invalid pixels
+// returns 1 if new image converted, 0 if not ready or stream broken
+
+extern "C" int tofh_meters (void *h, float *dest, int block, int mm)
+{
+  return ((jhcTofCam *) h)->RangeMeters(dest, block, mm);
+}
+
+
+//= Copy most recent depth image into caller's "dest" (20000 bytes).
+// same as tofh_range() but image never changes underneath caller
+// returns 1 if new image copied, 0 if not ready or stream broken
+
+extern "C" int tofh_range_into (void *h, unsigned char *dest, int block)
+{
+  return ((jhcTofCam *) h)->RangeCopy(dest, block);
+}
+
+
+//= Set camera intrinsics used for point clouds (before calling tofh_cloud).
+// "f" is focal length in pixels (0 = default 76.1), "cx" and "cy" are 
+// optical center in upright image (USB on left: x right, y down)
+
+extern "C" void tofh_optics (void *h, float f, float cx, float cy)
+{
+  ((jhcTofCam *) h)->Optics(f, cx, cy);
+}
+
+
+//= Convert image last returned by tofh_range() into 3D points (in meters).
+// camera coordinates: x right, y down, z out (USB on left)
+// "dest" gets x y z triples for every "step" pixel (needs 30000 floats max)
+// if "pack" > 0 skips invalid pixels, else leaves them as NaN triples
+// returns number of points written (0 if no image)
+
+extern "C" int tofh_cloud (void *h, float *dest, int step, int pack)
+{
+  return ((jhcTofCam *) h)->Cloud(dest, step, pack);
+}
+
+
+//= Whether sensor is streaming: 1 = running, 0 = stream broken, -1 = stopped.
+// lets caller tell a slow frame from a dead sensor when Range() gives NULL
+
+extern "C" int tofh_status (void *h)
+{
+  return ((jhcTofCam *) h)->Status();
+}
+
+
+//= Set longest time blocking calls (range, grab, capture) wait for a frame.
+// default is 500 ms, returns NULL or short count if nothing by then
+
+extern "C" void tofh_timeout (void *h, int ms)
+{
+  ((jhcTofCam *) h)->Timeout(ms);
+}
+
+
+//= Reopen sensor automatically if serial stream dies (0 = off, default).
+// retries with exponential backoff up to ms between attempts
+
+extern "C" void tofh_reconnect (void *h, int ms)
+{
+  ((jhcTofCam *) h)->Reconnect(ms);
+}
+
+
+//= File descriptor that becomes readable when a new frame is ready.
+// for select, poll, or asyncio add_reader - read 8 bytes to clear
+// also signalled when stream ends, returns negative if not available
+
+extern "C" int tofh_notify (void *h)
+{
+  return ((jhcTofCam *) h)->Notify();
+}
+
+
+//= Copy capture information for image last returned by tofh_range().
+// gives monotonic time stamp (ns), frame count, depth step, and frames skipped
+// returns 1 if okay, 0 if no image returned yet
+
+extern "C" int tofh_meta (void *h, jhcTofMeta *dest)
+{
+  const jhcTofMeta *m = ((jhcTofCam *) h)->Meta();
+
+  if ((m == NULL) || (dest == NULL))
+    return 0;
+  *dest = *m;
+  return 1;
+}
+
+
+//= Get packed validity bits for some range image (NULL = last Range).
+// 1250 bytes with MSB of first byte for pixel 0, bit = 0 if invalid
+// returns NULL if image is not a library output buffer
+
+extern "C" const unsigned char *tofh_valid (void *h, const unsigned char *img)
+{
+  return ((jhcTofCam *) h)->Valid(img);
+}
+
+
+//= Record next "n" consecutive depth images into a contiguous array.
+// "dest" must hold n * 20000 bytes, "meta" (can be NULL) gets n entries
+// returns number of images actually recorded (check "frame" for gaps)
+
+extern "C" int tofh_capture (void *h, int n, unsigned char *dest, jhcTofMeta *meta)
+{
+  return ((jhcTofCam *) h)->Capture(n, dest, meta);
+}
+
+
+//= Lease the most recent 16 bit depth image (independent of tofh_range).
+// image is guaranteed unchanged until matching tofh_release() call
+// fills in "meta" (can be NULL) with capture information for image
+// returns pixel buffer pointer, NULL if no frame yet or all buffers busy
+
+extern "C" const unsigned char *tofh_acquire (void *h, jhcTofMeta *meta)
+{
+  return ((jhcTofCam *) h)->Acquire(meta);
+}
+
+
+//= Give back a depth image obtained from tofh_acquire() so it can be reused.
+
+extern "C" void tofh_release (void *h, const unsigned char *buf)
+{
+  ((jhcTofCam *) h)->Release(buf);
+}
+
+
+//= Make an independent reader cursor (for a separate consumer thread).
+// each cursor has its own last seen frame and pinned image
+// needs one spare buffer (see tofh_pool), best made before first tofh_start
+// returns cursor number (1-7), -1 if none available or no spare buffer
+
+extern "C" int tofh_reader (void *h)
+{
+  return ((jhcTofCam *) h)->AddReader();
+}
+
+
+//= Give up a reader cursor from tofh_reader() (and its pinned image).
+
+extern "C" void tofh_drop_reader (void *h, int rd)
+{
+  ((jhcTofCam *) h)->DropReader(rd);
+}
+
+
+//= Same as tofh_range() but for reader cursor "rd" (0 = tofh_range itself).
+// image guaranteed unchanged until next tofh_read() with same cursor
+
+extern "C" const unsigned char *tofh_read (void *h, int rd, int block)
+{
+  return ((jhcTofCam *) h)->Range(block, rd);
+}
+
+
+//= Same as tofh_grab() but for reader cursor "rd".
+
+extern "C" int tofh_read_grab (void *h, int rd, jhcTofShot *dest, int block, int sh)
+{
+  return ((jhcTofCam *) h)->Grab(dest, block, sh, rd);
+}
+
+
+//= Same as tofh_meters() but for reader cursor "rd".
+
+extern "C" int tofh_read_meters (void *h, int rd, float *dest, int block, int mm)
+{
+  return ((jhcTofCam *) h)->RangeMeters(dest, block, mm, rd);
+}
+
+
+//= Same as tofh_meta() but for image last read by cursor "rd".
+
+extern "C" int tofh_read_meta (void *h, int rd, jhcTofMeta *dest)
+{
+  const jhcTofMeta *m = ((jhcTofCam *) h)->Meta(rd);
+
+  if ((m == NULL) || (dest == NULL))
+    return 0;
+  *dest = *m;
+  return 1;
+}
+
+
+//= Same as tofh_cloud() but for image last read by cursor "rd".
+
+extern "C" int tofh_read_cloud (void *h, int rd, float *dest, int step, int pack)
 {
-  return tof.Range(block);
+  return ((jhcTofCam *) h)->Cloud(dest, step, pack, rd);
+}
+
+
+//= Same as tofh_range_into() but for reader cursor "rd".
+
+extern "C" int tofh_read_into (void *h, int rd, unsigned char *dest, int block)
+{
+  return ((jhcTofCam *) h)->RangeCopy(dest, block, rd);
+}
+
+
+//= Same as tofh_valid(NULL) but for image last read by cursor "rd".
+
+extern "C" const unsigned char *tofh_read_valid (void *h, int rd)
+{
+  return ((jhcTofCam *) h)->Valid(NULL, rd);
 }
 
 
 //= Stop background thread and close USB connection.
 
-extern "C" void tof_done ()
+extern "C" void tofh_done (void *h)
 {
-  tof.Done();
+  ((jhcTofCam *) h)->Done();
 }
 
 
 /////////////////////////////////////////////////////////////////////////////
-//                          Debugging Functions                            //
+//                       Handle Debugging Functions                        //
 /////////////////////////////////////////////////////////////////////////////
 
 //= Current range step (in mm) used by hardware sensor.
 
-extern "C" int tof_step () 
+extern "C" int tofh_step (void *h) 
 {
-  return tof.Step();
+  return ((jhcTofCam *) h)->Step();
 }
 
 
 //= Get current raw sensor image for debugging.
 // Note: image used by processing - do not alter pixels!
 
-extern "C" const unsigned char *tof_sensor () 
+extern "C" const unsigned char *tofh_sensor (void *h) 
 {
-  return tof.Sensor();
+  return ((jhcTofCam *) h)->Sensor();
 }
 
 
@@ -91,9 +376,9 @@ extern "C" const unsigned char *tof_sensor ()
 // spatial filtering removes edge artifacts and shot noise
 // Note: image used by processing - do not alter pixels!
 
-extern "C" const unsigned char *tof_median ()
+extern "C" const unsigned char *tofh_median (void *h)
 {
-  return tof.Median();
+  return ((jhcTofCam *) h)->Median();
 }
 
 
@@ -101,9 +386,9 @@ extern "C" const unsigned char *tof_median ()
 // temporal filtering removes flickering and waves
 // Note: image used by processing - do not alter pixels!
 
-extern "C" const unsigned char *tof_kalman () 
+extern "C" const unsigned char *tofh_kalman (void *h) 
 {
-  return tof.Kalman();
+  return ((jhcTofCam *) h)->Kalman();
 }
 
 
@@ -111,8 +396,463 @@ extern "C" const unsigned char *tof_kalman ()
 // "sh" sets max range: 0 = 25cm, 1 = 51cm, 2 = 102cm, 3 = 204cm, 4 = 409cm 
 // Note: must call Range(1) first to update source image to converter
 
+extern "C" const unsigned char *tofh_night (void *h, int sh)
+{
+  return ((jhcTofCam *) h)->Night(sh);
+}
+
+
+//= Copy current raw sensor image into caller's "dest" (10000 bytes).
+// waits for processing step to finish so never half updated
+// returns 1 if okay, 0 for problem
+
+extern "C" int tofh_sensor_into (void *h, unsigned char *dest)
+{
+  return ((jhcTofCam *) h)->DebugCopy(dest, 0);
+}
+
+
+//= Copy consistent median filtered image into caller's "dest" (10000 bytes).
+// waits for processing step to finish so never half updated
+// returns 1 if okay, 0 for problem
+
+extern "C" int tofh_median_into (void *h, unsigned char *dest)
+{
+  return ((jhcTofCam *) h)->DebugCopy(dest, 1);
+}
+
+
+//= Copy consistent Kalman filtered image into caller's "dest" (10000 bytes).
+// waits for processing step to finish so never half updated
+// returns 1 if okay, 0 for problem
+
+extern "C" int tofh_kalman_into (void *h, unsigned char *dest)
+{
+  return ((jhcTofCam *) h)->DebugCopy(dest, 2);
+}
+
+
+//= Same as tofh_night() but writes into caller's "dest" (10000 bytes).
+// returns 1 if okay, 0 if no range image yet
+
+extern "C" int tofh_night_into (void *h, unsigned char *dest, int sh)
+{
+  return ((jhcTofCam *) h)->NightCopy(dest, sh);
+}
+
+
+//= Register a function run by acquisition thread for each new frame.
+// fn gets image, metadata, and user pointer (image only valid during call)
+// pass fn = NULL to remove any previous function
+
+extern "C" void tofh_set_callback (void *h, jhcTofHook fn, void *user)
+{
+  ((jhcTofCam *) h)->Callback(fn, user);
+}
+
+
+//= Copy each new frame into a named POSIX shared memory ring.
+// lets other processes read frames without the serial port (see TofCamClient)
+// name = NULL removes ring, returns 1 if okay, 0 for problem
+
+extern "C" int tofh_publish (void *h, const char *name, int slots)
+{
+  return ((jhcTofCam *) h)->Publish(name, slots);
+}
+
+
+//= Get a snapshot of acquisition health counters since start.
+// frames received, junk bytes, timeouts, unit changes, frames never used,
+// packets dropped as corrupt, sensor frames lost (from header frame ids),
+// reconnections made and total ms spent reconnecting,
+// histogram of inter-frame intervals (10ms bins, last is 190ms+), and
+// histogram of frame age when range returned (5ms bins, last is 95ms+)
+
+extern "C" void tofh_stats (void *h, jhcTofStats *dest)
+{
+  ((jhcTofCam *) h)->Stats(dest);
+}
+
+
+//= Get current values of processing parameters (including pending ones).
+
+extern "C" void tofh_get_params (void *h, jhcTofParams *p)
+{
+  ((jhcTofCam *) h)->GetParams(p);
+}
+
+
+//= Request new processing parameters (safe while sensor is running).
+// values are forced into legal ranges then all swapped in together
+// before processing of the next frame
+
+extern "C" void tofh_set_params (void *h, const jhcTofParams *p)
+{
+  ((jhcTofCam *) h)->SetParams(p);
+}
+
+
+//= Address of one of the fixed 16 bit output buffers (0 to pool size - 1).
+// tofh_range() only ever returns one of these so views can be cached
+// returns NULL if index out of bounds
+
+extern "C" const unsigned char *tofh_buffer (void *h, int i)
+{
+  return ((jhcTofCam *) h)->Buffer(i);
+}
+
+
+///////////////////////////////////////////////////////////////////////////
+//                     Single Sensor Main Functions                      //
+///////////////////////////////////////////////////////////////////////////
+
+//= Set number of 16 bit output buffers (before first start, 3 or more).
+
+extern "C" int tof_pool (int k)
+{
+  return tofh_pool(&tof, k);
+}
+
+
+//= Choose orientation of output images (0 = scan order, 1 = upright).
+
+extern "C" void tof_upright (int up)
+{
+  tofh_upright(&tof, up);
+}
+
+
+//= Open connection to sensor and start background acquisition thread.
+// same as tofh_start() but for default sensor 
+
+extern "C" int tof_start (int port)
+{
+  return tofh_start(&tof, port);
+}
+
+
+//= Get a pointer to the most recent 16 bit depth image from sensor.
+// same as tofh_range() but for default sensor 
+
+extern "C" const unsigned char *tof_range (int block)
+{
+  return tofh_range(&tof, block);
+}
+
+
+//= Get newest range image, night view, and capture information at once.
+
+extern "C" int tof_grab (jhcTofShot *dest, int block, int sh)
+{
+  return tofh_grab(&tof, dest, block, sh);
+}
+
+
+//= Get most recent depth image as floating point distances.
+
+extern "C" int tof_meters (float *dest, int block, int mm)
+{
+  return tofh_meters(&tof, dest, block, mm);
+}
+
+
+//= Copy most recent depth image into caller's "dest" (20000 bytes).
+
+extern "C" int tof_range_into (unsigned char *dest, int block)
+{
+  return tofh_range_into(&tof, dest, block);
+}
+
+
+//= Set camera intrinsics used for point clouds.
+
+extern "C" void tof_optics (float f, float cx, float cy)
+{
+  tofh_optics(&tof, f, cx, cy);
+}
+
+
+//= Convert image last returned by tof_range() into 3D points (in meters).
+
+extern "C" int tof_cloud (float *dest, int step, int pack)
+{
+  return tofh_cloud(&tof, dest, step, pack);
+}
+
+
+//= Whether sensor is streaming: 1 = running, 0 = stream broken, -1 = stopped.
+
+extern "C" int tof_status ()
+{
+  return tofh_status(&tof);
+}
+
+
+//= Set longest time blocking calls (range, grab, capture) wait for a frame.
+
+extern "C" void tof_timeout (int ms)
+{
+  tofh_timeout(&tof, ms);
+}
+
+
+//= Reopen sensor automatically if serial stream dies (0 = off, default).
+
+extern "C" void tof_reconnect (int ms)
+{
+  tofh_reconnect(&tof, ms);
+}
+
+
+//= File descriptor that becomes readable when a new frame is ready.
+
+extern "C" int tof_notify ()
+{
+  return tofh_notify(&tof);
+}
+
+
+//= Copy capture information for image last returned by tof_range().
+
+extern "C" int tof_meta (jhcTofMeta *dest)
+{
+  return tofh_meta(&tof, dest);
+}
+
+
+//= Get packed validity bits for some range image (NULL = last Range).
+
+extern "C" const unsigned char *tof_valid (const unsigned char *img)
+{
+  return tofh_valid(&tof, img);
+}
+
+
+//= Record next "n" consecutive depth images into a contiguous array.
+
+extern "C" int tof_capture (int n, unsigned char *dest, jhcTofMeta *meta)
+{
+  return tofh_capture(&tof, n, dest, meta);
+}
+
+
+//= Lease the most recent 16 bit depth image (independent of tof_range).
+
+extern "C" const unsigned char *tof_acquire (jhcTofMeta *meta)
+{
+  return tofh_acquire(&tof, meta);
+}
+
+
+//= Give back a depth image obtained from tof_acquire() so it can be reused.
+
+extern "C" void tof_release (const unsigned char *buf)
+{
+  tofh_release(&tof, buf);
+}
+
+
+//= Make an independent reader cursor (for a separate consumer thread).
+
+extern "C" int tof_reader ()
+{
+  return tofh_reader(&tof);
+}
+
+
+//= Give up a reader cursor from tof_reader() (and its pinned image).
+
+extern "C" void tof_drop_reader (int rd)
+{
+  tofh_drop_reader(&tof, rd);
+}
+
+
+//= Same as tof_range() but for reader cursor "rd" (0 = tof_range itself).
+
+extern "C" const unsigned char *tof_read (int rd, int block)
+{
+  return tofh_read(&tof, rd, block);
+}
+
+
+//= Same as tof_grab() but for reader cursor "rd".
+
+extern "C" int tof_read_grab (int rd, jhcTofShot *dest, int block, int sh)
+{
+  return tofh_read_grab(&tof, rd, dest, block, sh);
+}
+
+
+//= Same as tof_meters() but for reader cursor "rd".
+
+extern "C" int tof_read_meters (int rd, float *dest, int block, int mm)
+{
+  return tofh_read_meters(&tof, rd, dest, block, mm);
+}
+
+
+//= Same as tof_meta() but for image last read by cursor "rd".
+
+extern "C" int tof_read_meta (int rd, jhcTofMeta *dest)
+{
+  return tofh_read_meta(&tof, rd, dest);
+}
+
+
+//= Same as tof_cloud() but for image last read by cursor "rd".
+
+extern "C" int tof_read_cloud (int rd, float *dest, int step, int pack)
+{
+  return tofh_read_cloud(&tof, rd, dest, step, pack);
+}
+
+
+//= Same as tof_range_into() but for reader cursor "rd".
+
+extern "C" int tof_read_into (int rd, unsigned char *dest, int block)
+{
+  return tofh_read_into(&tof, rd, dest, block);
+}
+
+
+//= Same as tof_valid(NULL) but for image last read by cursor "rd".
+
+extern "C" const unsigned char *tof_read_valid (int rd)
+{
+  return tofh_read_valid(&tof, rd);
+}
+
+
+//= Stop background thread and close USB connection.
+// same as tofh_done() but for default sensor 
+
+extern "C" void tof_done ()
+{
+  tofh_done(&tof);
+}
+
+
+/////////////////////////////////////////////////////////////////////////////
+//                   Single Sensor Debugging Functions                     //
+/////////////////////////////////////////////////////////////////////////////
+
+//= Current range step (in mm) used by hardware sensor.
+
+extern "C" int tof_step () 
+{
+  return tofh_step(&tof);
+}
+
+
+//= Get current raw sensor image for debugging.
+
+extern "C" const unsigned char *tof_sensor () 
+{
+  return tofh_sensor(&tof);
+}
+
+
+//= Get current median filtered image for debugging.
+
+extern "C" const unsigned char *tof_median ()
+{
+  return tofh_median(&tof);
+}
+
+
+//= Get current Kalman filtered image for debugging.
+
+extern "C" const unsigned char *tof_kalman () 
+{
+  return tofh_kalman(&tof);
+}
+
+
+//= Make an 8 bit grayscale image where close things are BRIGHTER.
+
 extern "C" const unsigned char *tof_night (int sh)
 {
-  return tof.Night(sh);
+  return tofh_night(&tof, sh);
+}
+
+
+//= Copy consistent raw sensor image into caller's "dest".
+
+extern "C" int tof_sensor_into (unsigned char *dest)
+{
+  return tofh_sensor_into(&tof, dest);
+}
+
+
+//= Copy consistent median filtered image into caller's "dest".
+
+extern "C" int tof_median_into (unsigned char *dest)
+{
+  return tofh_median_into(&tof, dest);
+}
+
+
+//= Copy consistent Kalman filtered image into caller's "dest".
+
+extern "C" int tof_kalman_into (unsigned char *dest)
+{
+  return tofh_kalman_into(&tof, dest);
+}
+
+
+//= Same as tof_night() but writes into caller's "dest" (10000 bytes).
+
+extern "C" int tof_night_into (unsigned char *dest, int sh)
+{
+  return tofh_night_into(&tof, dest, sh);
+}
+
+
+//= Address of one of the fixed 16 bit output buffers.
+
+extern "C" const unsigned char *tof_buffer (int i)
+{
+  return tofh_buffer(&tof, i);
+}
+
+
+//= Register a function run by acquisition thread for each new frame.
+
+extern "C" void tof_set_callback (jhcTofHook fn, void *user)
+{
+  tofh_set_callback(&tof, fn, user);
+}
+
+
+//= Copy each new frame into a named POSIX shared memory ring.
+
+extern "C" int tof_publish (const char *name, int slots)
+{
+  return tofh_publish(&tof, name, slots);
+}
+
+
+//= Get a snapshot of acquisition health counters since start.
+
+extern "C" void tof_stats (jhcTofStats *dest)
+{
+  tofh_stats(&tof, dest);
+}
+
+
+//= Get current values of processing parameters (including pending ones).
+
+extern "C" void tof_get_params (jhcTofParams *p)
+{
+  tofh_get_params(&tof, p);
+}
+
+
+//= Request new processing parameters (safe while sensor is running).
+
+extern "C" void tof_set_params (const jhcTofParams *p)
+{
+  tofh_set_params(&tof, p);
 }
 
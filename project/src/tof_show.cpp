@@ -28,22 +28,21 @@
 #include <jhcTofCam.h>
 
 
-//= Convert scan by columns top-down rightmost first to OpenCV ordering.
-// also magnifies 100x100 image to 300x300 using block duplication
+//= Magnify upright 100x100 image to 300x300 using block duplication.
+// sensor set to give images already in OpenCV ordering
 
-void mono_rot3 (unsigned char *dest, const unsigned char *src)
+void mono_mag3 (unsigned char *dest, const unsigned char *src)
 {
-  int x, y, i, j;                      // src coords
-  unsigned char *d, *d0 = dest + 297;  // end of top row
+  int x, y, j;                         // src coords
+  unsigned char *d = dest;
   const unsigned char *s = src;   
 
   if ((dest == NULL) || (src == NULL))
     return;
-  for (x = 99; x >= 0; x--, d0 -= 3)
-    for (y = 0, d = d0; y < 100; y++, s++)
-      for (j = 0; j < 3; j++, d += 297)
-        for (i = 0; i < 3; i++, d++)
-          *d = *s;
+  for (y = 0; y < 100; y++, s += 100)
+    for (j = 0; j < 3; j++)
+      for (x = 0; x < 100; x++, d += 3)
+        d[0] = d[1] = d[2] = s[x];
 }
 
 
@@ -64,7 +63,8 @@ int main (int argc, char *argv[])
     if (sscanf(argv[1], "%d", &shift) != 1)
       return printf("usage: tof_show depth-downshift (0, 3, etc.)\n");
 
-  // try to start up sensor
+  // try to start up sensor (images in OpenCV order)
+  tof.upright = 1;
   if (tof.Start() <= 0)
   {
     printf("Could not connect to TOF sensor!\n");
@@ -94,10 +94,10 @@ int main (int argc, char *argv[])
   while ((pels = tof.Range(1)) != NULL)
   {
     // load OpenCV image data 
-    mono_rot3(raw.data, tof.Sensor());    
-    mono_rot3(med.data, tof.Median());  
-    mono_rot3(kal.data, tof.Kalman());  
-    mono_rot3(nite.data, tof.Night(shift));  
+    mono_mag3(raw.data, tof.Sensor());    
+    mono_mag3(med.data, tof.Median());  
+    mono_mag3(kal.data, tof.Kalman());  
+    mono_mag3(nite.data, tof.Night(shift));  
 
     // display new frames and pump update message
     cv::imshow("Sensor", raw);    
@@ -25,70 +25,840 @@
 # 
 # =========================================================================
 
-import numpy as np, cv2, sys, os, time
-from ctypes import CDLL, POINTER, cast, c_ubyte, c_void_p
+import numpy as np, sys, os, time
+from ctypes import CDLL, CFUNCTYPE, POINTER, Structure, byref
+from ctypes import c_ubyte, c_void_p, c_int, c_char_p, c_longlong, c_float
+from ctypes import memmove, sizeof
 
 
 # serial port number (only matters for Windows)
 port = 3
 
 
-# bind shared library  
-if sys.platform == 'win32':
-  lib = CDLL('lib/tof_cam.dll')                  # Windows
-else:
-  lib = CDLL('lib/libtof_cam.so')                # Linux
+# shared library (bound when first sensor is started)
+lib = None
 
 
-# define return types of image functions (buffer pointers)
-lib.tof_range.restype  = c_void_p
-lib.tof_sensor.restype = c_void_p
-lib.tof_median.restype = c_void_p
-lib.tof_kalman.restype = c_void_p
-lib.tof_night.restype  = c_void_p
+# capture information for a range image (mirrors jhcTofMeta)
+# stamp = CLOCK_MONOTONIC ns (same as time.monotonic_ns) when frame started
+# frame = count since Start, unit = depth step mm, skip = frames never read
+# orient = 0 for sensor scan order or 1 for upright image
+# fid = sensor's own frame id, lost = sensor frames missing just before this
+# temp = raw sensor temperature, expo = raw exposure time (from header)
 
+class TofMeta(Structure):
+  _fields_ = [('stamp', c_longlong), ('frame', c_int),
+              ('unit', c_int), ('skip', c_int), ('orient', c_int),
+              ('fid', c_int), ('lost', c_int), ('temp', c_int),
+              ('expo', c_int)]
 
-# Python wrapper for A010 Time-of-Flight camera interface
 
-class TofCam:
+# numpy equivalent of TofMeta for arrays of capture information
 
-  # connect to Time-of-Flight sensor over USB
-  # returns 1 if okay, 0 or negative for problem
+meta_dtype = np.dtype([('stamp', np.int64), ('frame', np.int32),
+                       ('unit', np.int32), ('skip', np.int32),
+                       ('orient', np.int32), ('fid', np.int32),
+                       ('lost', np.int32), ('temp', np.int32),
+                       ('expo', np.int32)], align=True)
 
-  def Start(self):
-    return lib.tof_start(port)
+
+# header of shared memory frame ring (mirrors jhcTofRing)
+
+ring_dtype = np.dtype([('magic', np.int32), ('slots', np.int32),
+                       ('bytes', np.int32), ('first', np.int32),
+                       ('live', np.int32), ('pid', np.int32),
+                       ('head', np.int64)])
+
+
+# adjustable processing parameters (mirrors jhcTofParams)
+# sat = max % saturated, pct = histogram percentile, ihi = desired span,
+# cx0 cy0 cw ch = auto-range ROI, f0 = smoothing time constant,
+# nv = expected noise variance, vlim = motion blanking, upright = orientation
+
+class TofParams(Structure):
+  _fields_ = [('sat', c_int), ('pct', c_int), ('ihi', c_int), 
+              ('cx0', c_int), ('cy0', c_int), ('cw', c_int), ('ch', c_int),
+              ('f0', c_float), ('nv', c_float), ('vlim', c_int),
+              ('upright', c_int)]
+
+
+# function run by library thread for each new frame (mirrors jhcTofHook)
+# ctypes takes the GIL before entering Python so no extra locking is needed
+
+TofHook = CFUNCTYPE(None, c_void_p, POINTER(TofMeta), c_void_p)
+
+
+# acquisition health counters since Start (mirrors jhcTofStats)
+# gap = histogram of inter-frame intervals in 10ms bins (last is 190ms+)
+# age = histogram of frame age when Range returned in 5ms bins (last is 95ms+)
+
+class TofStats(Structure):
+  _fields_ = [('frames', c_int), ('junk', c_int), ('tmo', c_int),
+              ('steps', c_int), ('over', c_int), ('bad', c_int),
+              ('lost', c_int), ('recon', c_int), ('down', c_int),
+              ('gap', c_int * 20), ('age', c_int * 20)]
+
+
+# make a TofCam property for one processing parameter (live adjustable)
+
+def param_prop(name):
+  def get(self):
+    return getattr(self.Params(), name)
+  def put(self, val):
+    self.Tune(**{name: val})
+  return property(get, put, doc="processing parameter " + name)
+
+
+# everything about a new frame from one library call (mirrors jhcTofShot)
+# rng and nite are buffer addresses (nite = 0 if not requested)
+
+class TofShot(Structure):
+  _fields_ = [('rng', c_void_p), ('nite', c_void_p), ('mask', c_void_p),
+              ('meta', TofMeta)]
+
+
+# record for each image delivered by TofCam.stream() (no per-object dict)
+# img = range view, meta = TofMeta copy, night = inverted 8 bit view (None 
+# unless shift given to stream), bits = 1250 byte packed validity from library
+# seq = library frame count, time = capture secs (time.monotonic clock),
+# step = depth step mm, skip = frames missed, mask = boolean valid pixels
+# views are recycled by library, use keep() for frames held in a history
+
+class Frame:
+  __slots__ = ('img', 'meta', 'night', 'bits', '_mask')
+
+  def __init__(self, img, meta, night =None, bits =None):
+    self.img = img
+    self.meta = meta
+    self.night = night
+    self.bits = bits
+    self._mask = None
+
+  seq  = property(lambda self: self.meta.frame)
+  time = property(lambda self: 1e-9 * self.meta.stamp)
+  step = property(lambda self: self.meta.unit)
+  skip = property(lambda self: self.meta.skip)
+  lost = property(lambda self: self.meta.lost)
+
+
+  # boolean (100, 100, 1) array of valid range pixels (unpacked on first use)
+
+  @property
+  def mask(self):
+    if self._mask is None:
+      if self.bits is None:
+        return None
+      self._mask = np.unpackbits(self.bits).view(bool).reshape(100, 100, 1)
+    return self._mask
+
+
+  # make a self-contained copy (20000 + 1250 bytes) that is never recycled
+  # night view is dropped since it is reused for every frame
+
+  def keep(self):
+    bits = None if self.bits is None else self.bits.copy()
+    return Frame(self.img.copy(), TofMeta.from_buffer_copy(self.meta), None, bits)
+
+
+# check that a caller's array can be filled directly by the library
+# needs exactly n contiguous writable elements of the given numpy type
+# returns address of data (raises ValueError if unsuitable)
+
+def out_ptr(out, dtype, n):
+  if (out.dtype != dtype or not out.flags.c_contiguous or 
+      not out.flags.writeable or out.size != n):
+    raise ValueError("out must be contiguous writable %s with %d pixels" % 
+                     (np.dtype(dtype).name, n))
+  return out.ctypes.data
+
+
+# stand-in for the handle functions on a library that only has the original
+# single sensor tof_xxx functions (e.g. the Windows DLL), all handles share it
+# covers Start, Range, Grab, Meta, stream, Done, and the debugging images
+# anything else raises AttributeError naming the missing handle function
+
+class TofLegacy:
+
+  def __init__(self, dll):
+    self.dll = dll
+    for fcn in (dll.tof_range, dll.tof_sensor, dll.tof_median,
+                dll.tof_kalman, dll.tof_night):
+      fcn.restype = c_void_p
+    self.live = -1
+    self.info = TofMeta()
+
+
+  def __getattr__(self, name):
+    raise AttributeError(name + " needs the handle-based (Linux) library")
+
+
+  # single sensor so handle is just a placeholder
+
+  def tof_open(self):
+    return 1
+
+
+  def tof_close(self, h):
+    self.tofh_done(h)
+
+
+  # device chosen by "port" variable instead, pool size is fixed
+
+  def tofh_device(self, h, name):
+    pass
+
+
+  def tofh_pool(self, h, k):
+    return 3
+
+
+  def tofh_start(self, h, port):
+    rc = self.dll.tof_start(port)
+    self.live = (1 if rc > 0 else -1)
+    self.info = TofMeta()
+    return rc
+
+
+  # original library cannot tell a broken stream from a slow one
+
+  def tofh_status(self, h):
+    return self.live
+
+
+  def tofh_done(self, h):
+    if self.live > 0:
+      self.dll.tof_done()
+    self.live = -1
+
+
+  # new range image, with capture information made up on this side
+
+  def tofh_read(self, h, rd, block):
+    ptr = self.dll.tof_range(block)
+    if ptr:
+      m = self.info
+      m.stamp = time.monotonic_ns()
+      m.frame += 1
+      m.unit = self.dll.tof_step()
+    return ptr
+
+
+  def tofh_range(self, h, block):
+    return self.tofh_read(h, 0, block)
+
+
+  # dest is byref to caller's TofMeta
+
+  def tofh_read_meta(self, h, rd, dest):
+    if self.info.frame <= 0:
+      return 0
+    memmove(dest, byref(self.info), sizeof(TofMeta))
+    return 1
+
+
+  # dest is byref to caller's TofShot (no validity mask available)
+
+  def tofh_read_grab(self, h, rd, dest, block, sh):
+    shot = TofShot()
+    shot.rng = self.tofh_read(h, rd, block)
+    if not shot.rng:
+      return 0
+    if sh >= 0:
+      shot.nite = self.dll.tof_night(sh)
+    shot.meta = self.info
+    memmove(dest, byref(shot), sizeof(TofShot))
+    return 1
 
 
+  def tofh_step(self, h):
+    return self.dll.tof_step()
+
+
+  def tofh_sensor(self, h):
+    return self.dll.tof_sensor()
+
+
+  def tofh_median(self, h):
+    return self.dll.tof_median()
+
+
+  def tofh_kalman(self, h):
+    return self.dll.tof_kalman()
+
+
+  def tofh_night(self, h, sh):
+    return self.dll.tof_night(sh)
+
+
+# find and bind shared library, only done once (not at import)
+# uses TOF_CAM_LIB environment variable if set, else "lib" next to this file
+# falls back to TofLegacy if library lacks the handle functions
+# returns library object (throws OSError if not found)
+
+def bind_lib():
+  global lib
+  if lib is not None:
+    return lib
+
+  # locate library independent of current working directory
+  path = os.environ.get('TOF_CAM_LIB')
+  if not path:
+    if sys.platform == 'win32':
+      name = 'tof_cam.dll'                       # Windows
+    else:
+      name = 'libtof_cam.so'                     # Linux
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib', name)
+  dll = CDLL(path)
+  if not hasattr(dll, 'tof_open'):
+    lib = TofLegacy(dll)
+    return lib
+
+  # sensor handles are pointers (must not be truncated to int)
+  dll.tof_open.restype   = c_void_p
+  dll.tof_close.argtypes = [c_void_p]
+  dll.tofh_device.argtypes = [c_void_p, c_char_p]
+  dll.tofh_pool.argtypes   = [c_void_p, c_int]
+  dll.tofh_upright.argtypes = [c_void_p, c_int]
+  dll.tofh_start.argtypes  = [c_void_p, c_int]
+  dll.tofh_range.argtypes  = [c_void_p, c_int]
+  dll.tofh_meters.argtypes = [c_void_p, c_void_p, c_int, c_int]
+  dll.tofh_grab.argtypes   = [c_void_p, POINTER(TofShot), c_int, c_int]
+  dll.tofh_optics.argtypes = [c_void_p, c_float, c_float, c_float]
+  dll.tofh_cloud.argtypes  = [c_void_p, c_void_p, c_int, c_int]
+  dll.tofh_timeout.argtypes = [c_void_p, c_int]
+  dll.tofh_reconnect.argtypes = [c_void_p, c_int]
+  dll.tofh_status.argtypes = [c_void_p]
+  dll.tofh_notify.argtypes = [c_void_p]
+  dll.tofh_meta.argtypes   = [c_void_p, POINTER(TofMeta)]
+  dll.tofh_capture.argtypes = [c_void_p, c_int, c_void_p, c_void_p]
+  dll.tofh_acquire.argtypes = [c_void_p, POINTER(TofMeta)]
+  dll.tofh_release.argtypes = [c_void_p, c_void_p]
+  dll.tofh_done.argtypes   = [c_void_p]
+  dll.tofh_step.argtypes   = [c_void_p]
+  dll.tofh_sensor.argtypes = [c_void_p]
+  dll.tofh_median.argtypes = [c_void_p]
+  dll.tofh_kalman.argtypes = [c_void_p]
+  dll.tofh_night.argtypes  = [c_void_p, c_int]
+  dll.tofh_get_params.argtypes = [c_void_p, POINTER(TofParams)]
+  dll.tofh_set_params.argtypes = [c_void_p, POINTER(TofParams)]
+  dll.tofh_stats.argtypes  = [c_void_p, POINTER(TofStats)]
+  dll.tofh_set_callback.argtypes = [c_void_p, TofHook, c_void_p]
+  dll.tofh_publish.argtypes = [c_void_p, c_char_p, c_int]
+  dll.tofh_valid.argtypes  = [c_void_p, c_void_p]
+  dll.tofh_reader.argtypes = [c_void_p]
+  dll.tofh_drop_reader.argtypes = [c_void_p, c_int]
+  dll.tofh_read.argtypes   = [c_void_p, c_int, c_int]
+  dll.tofh_read_grab.argtypes = [c_void_p, c_int, POINTER(TofShot), c_int, c_int]
+  dll.tofh_read_meters.argtypes = [c_void_p, c_int, c_void_p, c_int, c_int]
+  dll.tofh_read_meta.argtypes = [c_void_p, c_int, POINTER(TofMeta)]
+  dll.tofh_read_cloud.argtypes = [c_void_p, c_int, c_void_p, c_int, c_int]
+  dll.tofh_read_valid.argtypes = [c_void_p, c_int]
+  dll.tofh_read_into.argtypes = [c_void_p, c_int, c_void_p, c_int]
+  dll.tofh_sensor_into.argtypes = [c_void_p, c_void_p]
+  dll.tofh_median_into.argtypes = [c_void_p, c_void_p]
+  dll.tofh_kalman_into.argtypes = [c_void_p, c_void_p]
+  dll.tofh_night_into.argtypes = [c_void_p, c_void_p, c_int]
+
+  # define return types of image functions (buffer pointers)
+  dll.tofh_range.restype  = c_void_p
+  dll.tofh_sensor.restype = c_void_p
+  dll.tofh_median.restype = c_void_p
+  dll.tofh_kalman.restype = c_void_p
+  dll.tofh_night.restype  = c_void_p
+  dll.tofh_acquire.restype = c_void_p
+  dll.tofh_valid.restype   = c_void_p
+  dll.tofh_read.restype    = c_void_p
+  dll.tofh_read_valid.restype = c_void_p
+
+  # output buffer list is optional (views are otherwise made on first sight)
+  if hasattr(dll, 'tofh_buffer'):
+    dll.tofh_buffer.argtypes = [c_void_p, c_int]
+    dll.tofh_buffer.restype = c_void_p
+  lib = dll
+  return lib
+
+
+# owner of a library handle, which is only closed once the TofCam and every
+# image view made from its buffers are gone (each view refers to this)
+
+class TofHandle:
+
+  def __init__(self, h):
+    self.h = h
+
+
+  def __del__(self):
+    if lib is not None and self.h:
+      lib.tof_close(self.h)
+    self.h = None
+
+
+# a leased range image that stays valid until released
+# release by calling release(), leaving a "with" block, or dropping object
+# img = range view (do not use after release), meta = TofMeta copy
+
+class TofLease:
+
+  def __init__(self, cam, ptr, img, meta):
+    self.cam = cam
+    self.ptr = ptr
+    self.img = img
+    self.meta = meta
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, *args):
+    self.release()
+
+
+  def __del__(self):
+    self.release()
+
+
+  # give buffer back to library (safe to call more than once)
+
+  def release(self):
+    if self.ptr and lib is not None and self.cam.h is not None:
+      lib.tofh_release(self.cam.h, self.ptr)
+    self.ptr = None
+    self.img = None
+
+
+# image access shared by TofCam and TofReader 
+# needs h, owner, rd, views, meta, and shot
+# each cursor rd has its own last seen frame and pinned image in library
+
+class TofCursor:
+
   # get 16 bit range image, possibly waiting for new frame (block = 1)
   # image is 100x100 pixels with depth in 0.25mm steps
+  # needs 90 degree clockwise rotation for display unless Upright set
   # image fmt: 0 = buffer pointer (int), 1 = OpenCV Mat (numpy ndarray)
+  # can supply out = 100x100 uint16 array to get a private copy instead
   # returns pointer to image or None if not ready or broken
 
-  def Range(self, block =0, fmt =1):
-    return self.fmt_pels(lib.tof_range(block), fmt, 16)
+  def Range(self, block =0, fmt =1, out =None):
+    if out is not None:
+      ptr = out_ptr(out, np.uint16, 10000)
+      if self.h is None or lib.tofh_read_into(self.h, self.rd, ptr, block) <= 0:
+        return None
+      return out
+    if self.h is None:
+      return None
+    return self.fmt_pels(lib.tofh_read(self.h, self.rd, block), fmt, 16)
+
+
+  # get range image as float32 meters (or mm), NaN where invalid
+  # can supply out = 100x100 float32 array to fill (else allocated)
+  # returns filled array or None if not ready or broken (as for Range)
+
+  def RangeMeters(self, block =0, out =None, mm =0):
+    if out is None:
+      out = np.empty((100, 100, 1), np.float32)
+    ptr = out_ptr(out, np.float32, 10000)
+    if self.h is None or lib.tofh_read_meters(self.h, self.rd, ptr, block, mm) <= 0:
+      return None
+    return out
+
+
+  # convert image last returned by Range into 3D points in meters
+  # x right, y down, z out (USB on left), samples every step pixels
+  # pack = 1 drops invalid pixels, pack = 0 keeps them as NaN rows
+  # can supply out = (N, 3) float32 array to fill (else allocated)
+  # returns (n, 3) view of points or None if no image
+
+  def Cloud(self, out =None, step =1, pack =1):
+    side = (99 // max(step, 1)) + 1
+    if out is None:
+      out = np.empty((side * side, 3), np.float32)
+    elif (out.dtype != np.float32 or not out.flags.c_contiguous or 
+          not out.flags.writeable or out.size % 3 != 0 or
+          out.size < 3 * side * side):
+      raise ValueError("out must be contiguous writable (N, 3) float32 "
+                       "with N >= %d" % (side * side))
+    if self.h is None:
+      return None
+    n = lib.tofh_read_cloud(self.h, self.rd, out.ctypes.data, step, pack)
+    if n <= 0:
+      return None
+    return out.reshape(-1, 3)[:n]
+
+
+  # get new range image, night view (if shift >= 0), and info in one call
+  # cheaper than Range then Night then Meta (single library crossing)
+  # returns (range, night, TofMeta) with reused meta, range None if no frame
+
+  def Grab(self, block =0, shift =-1, fmt =1):
+    if self.h is None or lib.tofh_read_grab(self.h, self.rd, byref(self.shot), block, shift) <= 0:
+      return None, None, None
+    shot = self.shot
+    return (self.fmt_pels(shot.rng, fmt, 16), self.fmt_pels(shot.nite, fmt),
+            shot.meta)
+
+
+  # packed validity bits (1250 bytes, MSB first) for last Range image
+  # np.unpackbits(bits).reshape(100, 100, 1) gives 1 where range is valid
+  # returns view that stays with that image buffer, or None if none yet
+
+  def Valid(self, fmt =1):
+    if self.h is None:
+      return None
+    return self.fmt_pels(lib.tofh_read_valid(self.h, self.rd), fmt, 1)
+
+
+  # capture information for image last returned by Range
+  # returns TofMeta (reused object, overwritten each call) or None
+
+  def Meta(self):
+    if self.h is None or lib.tofh_read_meta(self.h, self.rd, byref(self.meta)) <= 0:
+      return None
+    return self.meta
+
+
+  # whether sensor is streaming: 1 = running, 0 = stream broken, -1 = stopped
+
+  def Status(self):
+    if self.h is None:
+      return -1
+    return lib.tofh_status(self.h)
+
+
+  # generate successive range images as Frame records until stream ends
+  # also makes night view at given shift (if any) in the same library call
+  # stops after max_frames (if given) or when sensor dies or Done() called 
+  # raises TimeoutError if no frame for timeout secs but sensor still alive
+  # fmt must be an image format (> 0) since Frame needs arrays, not pointers
+  # Note: img is a reused library buffer, valid until next frame requested
+
+  def stream(self, max_frames =None, timeout =1.0, shift =None, fmt =1):
+    if fmt <= 0:
+      raise ValueError("stream needs fmt > 0 (Frame holds arrays)")
+    sh = -1 if shift is None else shift
+    n = 0
+    while max_frames is None or n < max_frames:
+      limit = time.monotonic() + timeout
+      while True:
+        img, nite, m = self.Grab(1, sh, fmt)
+        if img is not None:
+          break
+        if self.Status() <= 0:
+          return
+        if time.monotonic() >= limit:
+          raise TimeoutError("No TOF frame for %3.1f secs" % timeout)
+      n += 1
+      bits = self.fmt_pels(self.shot.mask, fmt, 1)
+      yield Frame(img, TofMeta.from_buffer_copy(m), nite, bits)
 
 
   # convert a pointer to a byte sequence into an image object
+  # returns cached view of buffer (made on first sight if unknown)
 
   def fmt_pels(self, ptr, fmt, bits =8):
     if not ptr:
       return None
     if fmt <= 0:
       return ptr             # int = memory address
+    img = self.views.get(ptr)
+    if img is None:
+      img = self.wrap(ptr, bits)
+    return img
+
+
+  # make a persistent numpy view of some library buffer and cache it
+  # bits = 16 for range, 8 for night or debug, 1 for packed validity
+  # view keeps library handle alive so its memory is never freed under it
+
+  def wrap(self, ptr, bits =8):
+    if not ptr:
+      return None
+    if bits == 1:
+      buf = (c_ubyte * 1250).from_address(ptr)
+      buf.owner = self.owner
+      img = np.frombuffer(buf, np.uint8)
+      self.views[ptr] = img
+      return img
     if bits == 16:
-      buf = cast(ptr, POINTER(c_ubyte * 20000))
-      img = np.frombuffer(buf.contents, np.uint16)
+      buf = (c_ubyte * 20000).from_address(ptr)
+      buf.owner = self.owner
+      img = np.frombuffer(buf, np.uint16)
     else:
-      buf = cast(ptr, POINTER(c_ubyte * 10000))
-      img = np.frombuffer(buf.contents, np.uint8)
+      buf = (c_ubyte * 10000).from_address(ptr)
+      buf.owner = self.owner
+      img = np.frombuffer(buf, np.uint8)
     img.shape = (100, 100, 1)
+    self.views[ptr] = img
     return img
 
 
+# Python wrapper for A010 Time-of-Flight camera interface
+# each instance has its own library handle so several sensors can run
+
+class TofCam(TofCursor):
+
+  # processing parameters (changes take effect at next frame)
+  sat  = param_prop('sat')
+  pct  = param_prop('pct')
+  ihi  = param_prop('ihi')
+  cx0  = param_prop('cx0')
+  cy0  = param_prop('cy0')
+  cw   = param_prop('cw')
+  ch   = param_prop('ch')
+  f0   = param_prop('f0')
+  nv   = param_prop('nv')
+  vlim = param_prop('vlim')
+
+
+  # make an independent sensor interface (library handle made when needed)
+  # can give serial device name (e.g. "/dev/ttyUSB2") for multiple sensors
+  # pool = number of output buffers, each one beyond 3 allows one lease
+  # or one extra reader (grown for readers made before the first Start)
+  # image views keyed by buffer address (library buffers never move)
+
+  def __init__(self, dev =None, pool =3):
+    self.dev = dev
+    self.pool = pool
+    self.h = None
+    self.owner = None
+    self.views = {}
+    self.meta = TofMeta()
+    self.shot = TofShot()
+    self.rd = 0
+    self.hook = None
+    self.prev = None
+
+
+  # stop sensor when object goes away (handle itself is closed by
+  # TofHandle only after any image views still held elsewhere are gone)
+
+  def __del__(self):
+    h = getattr(self, 'h', None)
+    if lib is not None and h:
+      lib.tofh_done(h)
+
+
+  # connect to Time-of-Flight sensor over USB
+  # also views all fixed library buffers (if listed) so frames are free
+  # returns 1 if okay, 0 or negative for problem
+
+  def Start(self):
+    h = self.bind()
+    rc = lib.tofh_start(h, port)
+    self.views.clear()               # shared with readers
+    if hasattr(lib, 'tofh_buffer'):
+      i = 0
+      while self.wrap(lib.tofh_buffer(self.h, i), 16) is not None:
+        i += 1
+    for ptr in (lib.tofh_sensor(self.h), lib.tofh_median(self.h), 
+                lib.tofh_kalman(self.h)):
+      self.wrap(ptr, 8)
+    return rc
+
+
+  # get library handle for this sensor, making it on first use
+  # binds library if needed and applies device and pool size settings
+
+  def bind(self):
+    if self.h is None:
+      self.h = bind_lib().tof_open()
+      self.owner = TofHandle(self.h)
+      if self.dev is not None:
+        lib.tofh_device(self.h, self.dev.encode())
+      lib.tofh_pool(self.h, self.pool)
+    return self.h
+
+
+  # make an independent reader for another consumer thread (see TofReader)
+  # best made before first Start since each one needs another pool buffer
+  # returns TofReader or None if no cursor or spare buffer is available
+
+  def reader(self):
+    h = self.bind()
+    rd = lib.tofh_reader(h)
+    if rd <= 0:
+      return None
+    return TofReader(self, rd)
+
+
+  # longest time (ms) a blocking Range, Grab, or capture waits for a frame
+  # the thread sleeps until woken by the library (default 500 ms)
+
+  def Timeout(self, ms):
+    h = self.bind()
+    lib.tofh_timeout(h, ms)
+
+
+  # reopen sensor automatically if its serial stream dies (ms = 0 is off)
+  # retries with exponential backoff up to ms between attempts
+
+  def Reconnect(self, ms =1000):
+    h = self.bind()
+    lib.tofh_reconnect(h, ms)
+
+
+  # choose orientation of all images (can change while running)
+  # 0 = sensor scan order, 1 = upright OpenCV image with USB on left
+
+  def Upright(self, up =1):
+    self.Tune(upright=up)
+
+
+  # get copy of current processing parameters (including pending changes)
+  # returns TofParams structure (see also individual properties)
+
+  def Params(self):
+    p = TofParams()
+    h = self.bind()
+    lib.tofh_get_params(h, byref(p))
+    return p
+
+
+  # request new processing parameters all at once (safe while running)
+  # values are clamped to legal ranges and applied before next frame
+
+  def SetParams(self, p):
+    h = self.bind()
+    lib.tofh_set_params(h, byref(p))
+
+
+  # change just some processing parameters together, e.g. Tune(vlim=255)
+
+  def Tune(self, **vals):
+    p = self.Params()
+    for name, val in vals.items():
+      if not hasattr(p, name):
+        raise AttributeError("No TOF parameter " + name)
+      setattr(p, name, val)
+    self.SetParams(p)
+
+
+  # set camera intrinsics for point clouds (flen = 0 for default 76.1)
+  # optical center cx, cy is in upright image (USB on left)
+
+  def Optics(self, flen =0.0, cx =49.5, cy =49.5):
+    h = self.bind()
+    lib.tofh_optics(h, flen, cx, cy)
+
+
+  # snapshot of acquisition health counters since Start as a dict
+  # frames = packets received, junk = bytes skipped looking for header,
+  # tmo = read timeouts, steps = depth unit changes, over = frames never
+  # read, pushed, captured, or leased, bad = packets dropped for checksum
+  # or format errors, lost = sensor frames never received (from frame id
+  # gaps), recon = number of reconnections, down = ms spent reconnecting,
+  # gap = inter-frame interval histogram (10ms bins, last is 190ms+),
+  # age = frame age when Range returned histogram (5ms bins, last is 95ms+)
+
+  def Stats(self):
+    if self.h is None:
+      return None
+    st = TofStats()
+    lib.tofh_stats(self.h, byref(st))
+    return {'frames': st.frames, 'junk': st.junk, 'tmo': st.tmo,
+            'steps': st.steps, 'over': st.over, 'bad': st.bad,
+            'lost': st.lost, 'recon': st.recon, 'down': st.down,
+            'gap': list(st.gap), 'age': list(st.age)}
+
+
+  # record next n consecutive range images without returning to Python
+  # can supply out = (N >= n, 100, 100) uint16 array to fill (else allocated)
+  # meta = capture information array (meta_dtype), check "frame" for gaps
+  # returns (images, meta) trimmed to number actually received
+
+  def capture(self, n, out =None):
+    if out is None:
+      out = np.empty((n, 100, 100), np.uint16)
+    elif (out.dtype != np.uint16 or not out.flags.c_contiguous or 
+          not out.flags.writeable or out.ndim != 3 or out.shape[0] < n or
+          out.shape[1:] != (100, 100)):
+      raise ValueError("out must be contiguous writable (N, 100, 100) uint16 "
+                       "with N >= %d" % n)
+    meta = np.zeros(n, meta_dtype)
+    if self.h is None:
+      return out[:0], meta[:0]
+    got = lib.tofh_capture(self.h, n, out.ctypes.data, meta.ctypes.data)
+    return out[:got], meta[:got]
+
+
+  # lease most recent range image so it is not recycled (no copying)
+  # use as "with tof.lease() as f:" or keep object then release()
+  # at most pool - 3 different images can be leased at once (else None)
+  # returns TofLease (with img and meta) or None if no frame or no buffer
+
+  def lease(self):
+    if self.h is None:
+      return None
+    meta = TofMeta()
+    ptr = lib.tofh_acquire(self.h, byref(meta))
+    if not ptr:
+      return None
+    return TofLease(self, ptr, self.fmt_pels(ptr, 1, 16), meta)
+
+
+  # coroutine to wait for next range image without blocking asyncio loop
+  # sleeps on library event descriptor (no polling or executor threads)
+  # only one task per sensor should wait at a time (wrap in wait_for to limit)
+  # returns image (as for Range) or None if stream broken or stopped
+
+  async def next_frame(self, fmt =1):
+    import asyncio
+    if self.h is None:
+      return None
+    loop = asyncio.get_running_loop()
+    fd = lib.tofh_notify(self.h)
+    while True:
+      # clear signal then check (frame arriving after this sets it again)
+      try:
+        os.read(fd, 8)
+      except BlockingIOError:
+        pass
+      img = self.Range(0, fmt)
+      if img is not None or self.Status() <= 0:
+        return img
+
+      # sleep until background thread publishes something
+      wake = loop.create_future()
+      loop.add_reader(fd, lambda: wake.done() or wake.set_result(None))
+      try:
+        await wake
+      finally:
+        loop.remove_reader(fd)
+
+
+  # have fn(img, meta) run in the library thread as each frame is published
+  # img is only valid until fn returns (copy it to keep) and meta is a copy
+  # fn should be quick since it delays processing of the next frame
+  # pass fn = None to stop calls (fmt as for Range)
+
+  def Callback(self, fn, fmt =1):
+    h = self.bind()
+    if fn is None:
+      hook = TofHook()
+    else:
+      def relay(ptr, m, user):
+        fn(self.fmt_pels(ptr, fmt, 16), TofMeta.from_buffer_copy(m.contents))
+      hook = TofHook(relay)
+    lib.tofh_set_callback(h, hook, None)
+    self.prev = self.hook    # a call may still be in progress
+    self.hook = hook
+
+
+  # copy each new frame into a named shared memory ring for other processes
+  # these read it with TofCamClient (serial port stays with this process)
+  # name = None removes ring, returns 1 if okay, 0 for problem
+
+  def Publish(self, name ='/tof_cam', slots =8):
+    h = self.bind()
+    return lib.tofh_publish(h, name.encode() if name else None, slots)
+
+
   # cleanly disconnect imaging depth sensor
 
   def Done(self):
-    lib.tof_done()
+    if self.h is not None:
+      lib.tofh_done(self.h)
 
 
   # -------------------------------------------------------------------------
@@ -96,55 +866,319 @@ class TofCam:
   # current range step (in mm) used by hardware sensor
 
   def Step(self):
-    return lib.tof_step()
+    if self.h is None:
+      return 0
+    return lib.tofh_step(self.h)
 
 
   # get current raw sensor image for debugging
   # image fmt: 0 = buffer pointer (int), 1 = OpenCV Mat (numpy ndarray)
+  # can supply out = 100x100 uint8 array for a consistent copy
 
-  def Sensor(self, fmt =1):
-    return self.fmt_pels(lib.tof_sensor(), fmt)
+  def Sensor(self, fmt =1, out =None):
+    if self.h is None:
+      return None
+    if out is not None:
+      return out if lib.tofh_sensor_into(self.h, out_ptr(out, np.uint8, 10000)) > 0 else None
+    return self.fmt_pels(lib.tofh_sensor(self.h), fmt)
 
 
   # get current median filtered image for debugging
   # spatial filtering removes edge artifacts and shot noise
   # image fmt: 0 = buffer pointer (int), 1 = OpenCV Mat (numpy ndarray) 
+  # can supply out = 100x100 uint8 array for a consistent copy
 
-  def Median(self, fmt =1):
-    return self.fmt_pels(lib.tof_median(), fmt)
+  def Median(self, fmt =1, out =None):
+    if self.h is None:
+      return None
+    if out is not None:
+      return out if lib.tofh_median_into(self.h, out_ptr(out, np.uint8, 10000)) > 0 else None
+    return self.fmt_pels(lib.tofh_median(self.h), fmt)
 
 
   # get current Kalman filtered image for debugging
   # temporal filtering removes flickering and waves
   # image fmt: 0 = buffer pointer (int), 1 = OpenCV Mat (numpy ndarray)
+  # can supply out = 100x100 uint8 array for a consistent copy
 
-  def Kalman(self, fmt =1):
-    return self.fmt_pels(lib.tof_kalman(), fmt)
+  def Kalman(self, fmt =1, out =None):
+    if self.h is None:
+      return None
+    if out is not None:
+      return out if lib.tofh_kalman_into(self.h, out_ptr(out, np.uint8, 10000)) > 0 else None
+    return self.fmt_pels(lib.tofh_kalman(self.h), fmt)
 
 
   # get inverted 8 bit version depth image where bright means close 
   # max range from shift: 0 = 25cm, 1 = 50cm, 2 = 1m, 3 = 2m, 4 = 4m 
   # image fmt: 0 = buffer pointer (int), 1 = OpenCV Mat (numpy ndarray)
+  # can supply out = 100x100 uint8 array to fill instead
   # Note: must call Range(1) first to update source image conversion
 
-  def Night(self, shift =1, fmt =1):
-    return self.fmt_pels(lib.tof_night(shift), fmt)
+  def Night(self, shift =1, fmt =1, out =None):
+    if self.h is None:
+      return None
+    if out is not None:
+      return out if lib.tofh_night_into(self.h, out_ptr(out, np.uint8, 10000), shift) > 0 else None
+    return self.fmt_pels(lib.tofh_night(self.h, shift), fmt)
+
+
+# independent reader of a TofCam sensor for one consumer thread (see reader)
+# has its own last seen frame and pinned image so threads never recycle 
+# each other's images, while sharing the sensor's image views
+
+class TofReader(TofCursor):
+
+  def __init__(self, cam, rd):
+    self.cam = cam
+    self.rd = rd
+    self.views = cam.views
+    self.meta = TofMeta()
+    self.shot = TofShot()
+
+
+  # library handle of underlying sensor (and keeper of its memory)
+
+  @property
+  def h(self):
+    return self.cam.h
+
+
+  @property
+  def owner(self):
+    return self.cam.owner
+
+
+  def __del__(self):
+    self.close()
+
+
+  # give library cursor back (safe to call more than once)
+
+  def close(self):
+    if getattr(self, 'rd', 0) > 0 and lib is not None and self.cam.h is not None:
+      lib.tofh_drop_reader(self.cam.h, self.rd)
+    self.rd = -1
 
 
 # =========================================================================
 
-# simple test program
+# reads range images that another process shares using TofCam.Publish
+# images are zero-copy views into shared memory (no library or serial port)
+# a view stays intact for about slots - 1 more frames (see Intact)
+
+class TofCamClient:
+
+  # name must match the one given to Publish
+
+  def __init__(self, name ='/tof_cam'):
+    self.name = name
+    self.mm = None
+    self.hdr = None
+    self.ring = None
+    self.last = 0
+    self.meta = None
+
+
+  def __del__(self):
+    self.Done()
+
+
+  # map frame ring made by publisher (only frames after this are returned)
+  # returns 1 if okay, 0 if ring does not exist (yet)
+
+  def Start(self):
+    import mmap
+    self.Done()
+    try:
+      fd = os.open('/dev/shm/' + self.name.lstrip('/'), os.O_RDONLY)
+    except OSError:
+      return 0
+    try:
+      self.mm = mmap.mmap(fd, 0, mmap.MAP_SHARED, mmap.PROT_READ)
+    except (OSError, ValueError):
+      return 0
+    finally:
+      os.close(fd)
+    hdr = np.ndarray((), ring_dtype, buffer=self.mm)
+    if hdr['magic'] != 0x31466F54:
+      self.Done()
+      return 0
+
+    # overlay array of slots (seq, meta, img) on rest of ring
+    slot = np.dtype({'names': ['seq', 'meta', 'img'],
+                     'formats': [np.int64, meta_dtype, (np.uint16, (100, 100, 1))],
+                     'offsets': [0, 8, 8 + meta_dtype.itemsize],
+                     'itemsize': int(hdr['bytes'])})
+    self.ring = np.ndarray(int(hdr['slots']), slot, buffer=self.mm,
+                           offset=int(hdr['first']))
+    self.hdr = hdr
+    self.last = int(hdr['head'])
+    return 1
+
+
+  # get newest 16 bit range image not returned before (as for TofCam.Range)
+  # can wait up to timeout secs for next frame (block = 1)
+  # returns read-only view into shared memory or None if nothing new
+
+  def Range(self, block =0, timeout =1.0):
+    if self.hdr is None:
+      return None
+    quit = time.monotonic() + timeout
+    while True:
+      head = int(self.hdr['head'])
+      if head != self.last:
+        # slot seq is zeroed while rewritten so check before and after
+        i = head % len(self.ring)
+        if self.ring['seq'][i] == head:
+          meta = self.ring['meta'][i].copy()
+          if self.ring['seq'][i] == head:
+            self.last = head
+            self.meta = meta
+            return self.ring['img'][i]
+
+      # nothing new or slot being rewritten (publisher may have died)
+      if block <= 0 or self.hdr['live'] <= 0 or time.monotonic() > quit:
+        return None
+      time.sleep(0.001)
+
+
+  # capture information (meta_dtype record) for most recent Range image
+
+  def Meta(self):
+    return self.meta
+
+
+  # whether most recent Range image has not been overwritten yet
+  # call after using a view to be sure it was not changed underneath
+
+  def Intact(self):
+    if self.hdr is None or self.last <= 0:
+      return False
+    return self.ring['seq'][self.last % len(self.ring)] == self.last
+
+
+  # whether publisher is streaming: 1 = running, 0 = stopped, -1 = not mapped
+
+  def Status(self):
+    if self.hdr is None:
+      return -1
+    return int(self.hdr['live'])
+
+
+  # stop reading shared frames (unmapped once all views are gone)
+
+  def Done(self):
+    self.hdr = None
+    self.ring = None
+    if getattr(self, 'mm', None) is not None:
+      try:
+        self.mm.close()
+      except BufferError:
+        pass                 # views still exist somewhere
+      self.mm = None
+
+
+# =========================================================================
+
+# headless timing of a sensor for comparing builds and boards
+# runs for secs seconds or until frames images (whichever first)
+# ages and intervals are ms, call costs are us, cpu is secs
+# returns dict (suitable for JSON) or None if sensor would not start
+
+def bench(secs =10.0, frames =None, dev =None):
+  tof = TofCam(dev)
+  if tof.Start() <= 0:
+    return None
+  age = []
+  gap = []
+  prev = None
+  n = 0
+
+  # collect newest frames as fast as they come
+  c0 = time.thread_time()
+  p0 = time.process_time()
+  t0 = time.monotonic()
+  while time.monotonic() - t0 < secs:
+    if frames is not None and n >= frames:
+      break
+    if tof.Range(1) is None:
+      if tof.Status() <= 0:
+        break
+      continue
+    m = tof.Meta()
+    age.append((time.monotonic_ns() - m.stamp) / 1e6)
+    if prev is not None:
+      gap.append((m.stamp - prev) / 1e6)
+    prev = m.stamp
+    n += 1
+  elapsed = time.monotonic() - t0
+  loop_cpu = time.thread_time() - c0
+  proc_cpu = time.process_time() - p0
+
+  # cost of wrapper calls themselves (no new frame usually)
+  calls = {}
+  for name, fcn in (('range', lambda: tof.Range(0)), ('meta', tof.Meta),
+                    ('status', tof.Status), ('grab', lambda: tof.Grab(0))):
+    k = 2000
+    c = time.perf_counter()
+    for _ in range(k):
+      fcn()
+    calls[name] = 1e6 * (time.perf_counter() - c) / k
+  stats = tof.Stats() if hasattr(lib, 'tofh_stats') else None
+  tof.Done()
+
+  # summarize distributions
+  def pctl(vals):
+    if not vals:
+      return None
+    v = np.array(vals)
+    return {'p50': float(np.percentile(v, 50)), 'p90': float(np.percentile(v, 90)),
+            'p99': float(np.percentile(v, 99)), 'max': float(v.max()),
+            'mean': float(v.mean())}
+  return {'frames': n, 'secs': elapsed, 'fps': n / elapsed if elapsed > 0 else 0.0,
+          'age_ms': pctl(age), 'interval_ms': pctl(gap), 'call_us': calls,
+          'cpu': {'loop': loop_cpu, 'process': proc_cpu,
+                  'loop_pct': 100.0 * loop_cpu / elapsed if elapsed > 0 else 0.0,
+                  'process_pct': 100.0 * proc_cpu / elapsed if elapsed > 0 else 0.0},
+          'lib': stats}
+
+
+# =========================================================================
+
+# simple test program (--bench for headless timing as JSON)
 
 if __name__ == "__main__":             
-  sh = 1                               # default down-shift
-  if len(sys.argv) > 1:
-    if sys.argv[1].isdigit():
-      sh = int(sys.argv[1])
-    else:
-      print("argument = depth down-shift (0-4: default = 1)")
+  import argparse
+  ap = argparse.ArgumentParser(description="Stream A010 depth images")
+  ap.add_argument('shift', nargs='?', type=int, default=1,
+                  help="depth down-shift (0-4: default = 1)")
+  ap.add_argument('--bench', action='store_true',
+                  help="no display, print timing summary as JSON")
+  ap.add_argument('--secs', type=float, default=10.0,
+                  help="benchmark duration (default = 10)")
+  ap.add_argument('--frames', type=int, default=None,
+                  help="benchmark frame limit")
+  ap.add_argument('--dev', default=None, help="serial device name")
+  args = ap.parse_args()
+  sh = args.shift
+
+  # timing run without display
+  if args.bench:
+    import json
+    res = bench(args.secs, args.frames, args.dev)
+    if res is None:
+      print("Could not connect to TOF sensor!", file=sys.stderr)
+      sys.exit(1)
+    print(json.dumps(res, indent=2))
+    sys.exit(0)
+  import cv2                           # only needed for display
 
   # connect to sensor and make display window
-  tof = TofCam()  
+  tof = TofCam(args.dev)  
+  legacy = isinstance(bind_lib(), TofLegacy)
+  if not legacy:
+    tof.Upright(1)                     # no rotation needed
   if tof.Start() <= 0:
     print("Could not connect to TOF sensor!")
     sys.exit(0)
@@ -161,10 +1195,10 @@ if __name__ == "__main__":
   t0 = start
   ft = start
   try:
-    while tof.Range(1) is not None:
+    for f in tof.stream(shift=sh):
 
       # grab image
-      img = tof.Night(sh)
+      img = f.night
       i += 1
 
       # update rate estimate
@@ -178,12 +1212,15 @@ if __name__ == "__main__":
         t0 = now 
 
       # display image
-      rot = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-      big = cv2.resize(rot, (300, 300), interpolation=cv2.INTER_NEAREST) 
+      if legacy:
+        img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+      big = cv2.resize(img, (300, 300), interpolation=cv2.INTER_NEAREST) 
       cv2.imshow("Night", big) 
       cv2.waitKey(1)                   # pump update message
   except KeyboardInterrupt:
     print()
+  except TimeoutError as err:
+    print(err)
 
   # shutdown after error or Ctrl-C
   stop = time.time();